@@ -1,30 +1,176 @@
 import os
+import re
 import json
+import queue
+import random
+import asyncio
+import hashlib
+import threading
 import requests
+from requests.adapters import HTTPAdapter
 import time
-from datetime import datetime
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from logger_config import logger, DEBUG_API_CALLS_DIR, run_log_dir
 from token_utils import calculate_tokens, MAX_TOKENS
+from response_cache import ResponseCache, SemanticCache, SEMANTIC_CACHE_AVAILABLE
+
+# Try to import orjson for faster JSON (de)serialization on the API hot path
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+    logger.info("orjson available: using fast JSON serialization for API payloads")
+except ImportError:
+    ORJSON_AVAILABLE = False
+    logger.warning("orjson not available. Falling back to stdlib json.")
+    logger.warning("To enable, install: pip install orjson")
+
+# Try to import httpx for async API calls (optional dependency)
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+    logger.info("httpx available: async Gemini API calls enabled")
+except ImportError:
+    HTTPX_AVAILABLE = False
+    logger.warning("httpx not available. Async API calls disabled; falling back to synchronous requests.")
+    logger.warning("To enable, install: pip install httpx[http2]")
+
+MODEL_NAME = "gemini-1.5-pro"
+
+# Context caching endpoint and lifetime for stable prompt prefixes
+CACHED_CONTENT_URL = "https://generativelanguage.googleapis.com/v1beta/cachedContents"
+CACHED_CONTENT_TTL_SECONDS = 3600
+
+# Exponential backoff parameters for rate-limited retries
+BACKOFF_BASE_SECONDS = 1
+BACKOFF_CAP_SECONDS = 60
+BACKOFF_JITTER_SECONDS = 2
+
+# Maximum number of prompts packed into one batched request
+BATCH_MAX_PROMPTS = 6
+
+_BATCH_INSTRUCTION = (
+    "You will receive several independent prompts, each delimited by\n"
+    "===PROMPT_<i>_START=== and ===PROMPT_<i>_END=== markers.\n"
+    "Answer each prompt independently. Start each answer with a line that\n"
+    "contains exactly ===RESPONSE_<i>=== (matching the prompt index) and\n"
+    "nothing else. Do not add any text outside these sections.\n\n"
+)
+
+# Parses one ===RESPONSE_<i>=== section of a batched response
+_BATCH_RESPONSE_RE = re.compile(
+    r"===RESPONSE_(\d+)===\s*(.*?)(?====RESPONSE_\d+===|\Z)", re.S
+)
+
+# Finds the first non-blank line without splitting the whole prompt
+_FIRST_LINE_RE = re.compile(r"[^\s].*")
+
+def _build_request_data(text):
+    """Build the generateContent request skeleton for a single text part"""
+    return {
+        "contents": [
+            {
+                "parts": [
+                    {
+                        "text": text
+                    }
+                ]
+            }
+        ]
+    }
+
+def _json_dumps_str(obj, indent=False):
+    """Serialize to a JSON string with orjson when available"""
+    if ORJSON_AVAILABLE:
+        if indent:
+            return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode('utf-8')
+        return orjson.dumps(obj).decode('utf-8')
+    return json.dumps(obj, indent=2 if indent else None)
+
+def _json_loads_response(response):
+    """Parse a JSON response body with orjson when available"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(response.content)
+    return response.json()
 
 class GeminiAPI:
-    def __init__(self, api_key, debug_ai_calls=False):
+    def __init__(self, api_key, debug_ai_calls=False, use_cache=True, semantic_cache=False, enable_accounting=True):
         self.api_key = api_key
         self.debug_ai_calls = debug_ai_calls
         self.root_dir = os.getcwd()
-        # Create debug directory if needed
-        if self.debug_ai_calls:
-            os.makedirs(DEBUG_API_CALLS_DIR, exist_ok=True)
-            logger.info(f"Debug AI calls directory created at: {DEBUG_API_CALLS_DIR}")
+
+        # Optional exact-match response cache keyed on (model, prompt)
+        self.response_cache = None
+        if use_cache:
+            try:
+                self.response_cache = ResponseCache()
+            except Exception as e:
+                logger.error(f"Failed to initialize response cache: {str(e)}")
+                logger.warning("Continuing without response caching")
+
+        # Optional semantic cache layer for near-duplicate prompts
+        # (off by default since it pulls in the embedding model)
+        self.semantic_cache = None
+        if semantic_cache and SEMANTIC_CACHE_AVAILABLE:
+            try:
+                self.semantic_cache = SemanticCache()
+            except Exception as e:
+                logger.error(f"Failed to initialize semantic cache: {str(e)}")
+                logger.warning("Continuing without semantic caching")
+        elif semantic_cache:
+            logger.warning("Semantic cache requested but embedding dependencies are missing")
+
+        # Reuse a single HTTP session so repeated API calls share one
+        # TCP+TLS connection instead of paying a fresh handshake each time
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=10, max_retries=0))
+        # Ask for compressed response bodies explicitly; large JSON payloads
+        # compress several-fold and urllib3 decompresses transparently
+        # (brotli is used when the brotli package is installed)
+        self.session.headers.update({
+            "Content-Type": "application/json",
+            "Accept-Encoding": "gzip, br"
+        })
+        logger.info("HTTP session initialized with connection pooling (keep-alive enabled)")
+
+        # Async client is created lazily on first acall_gemini_api use
+        self.aclient = None
+
+        # Handles for server-side cached prompt prefixes, keyed by prefix hash
+        self._prefix_cache = {}
+
+        # In-flight async calls keyed by prompt hash, so concurrent duplicate
+        # prompts share one API round-trip instead of racing past the cache
+        self._inflight = {}
+        self._inflight_lock = asyncio.Lock()
+
+        # Debug payloads and accounting lines are persisted off the hot path
+        # by a single daemon thread so API calls don't block on file I/O
+        self._debug_q = queue.Queue()
+        self._debug_thread = threading.Thread(target=self._debug_writer, daemon=True)
+        self._debug_thread.start()
+        # The debug directory is created lazily on the first debug write
+        self._debug_dir_ready = False
         
         # Create a token accounting file with simple precise header
-        self.token_accounting_file = os.path.join(run_log_dir, "token_accounting.txt")
-        with open(self.token_accounting_file, 'w', encoding='utf-8') as f:
-            f.write("TOKEN ACCOUNTING SUMMARY\n")
-            f.write("=======================\n\n")
-            f.write("Date: " + datetime.now().strftime("%Y-%m-%d %H:%M:%S") + "\n\n")
-            f.write("TIMESTAMP           | FILE OR PROMPT                             | TYPE             | INPUT TOKENS | OUTPUT TOKENS | TOTAL TOKENS\n")
-            f.write("--------------------|-------------------------------------------|------------------|--------------|---------------|-------------\n")
-        logger.info(f"Token accounting file created at: {self.token_accounting_file}")
+        # (skipped entirely when accounting is disabled)
+        self.enable_accounting = enable_accounting
+        self.token_accounting_file = None
+        self._acct_fh = None
+        if self.enable_accounting:
+            self.token_accounting_file = os.path.join(run_log_dir, "token_accounting.txt")
+            with open(self.token_accounting_file, 'w', encoding='utf-8') as f:
+                f.write("TOKEN ACCOUNTING SUMMARY\n")
+                f.write("=======================\n\n")
+                f.write("Date: " + datetime.now().strftime("%Y-%m-%d %H:%M:%S") + "\n\n")
+                f.write("TIMESTAMP           | FILE OR PROMPT                             | TYPE             | INPUT TOKENS | OUTPUT TOKENS | TOTAL TOKENS\n")
+                f.write("--------------------|-------------------------------------------|------------------|--------------|---------------|-------------\n")
+            # Keep one line-buffered append handle open for the whole run instead
+            # of paying an open/close syscall pair on every accounting row
+            self._acct_fh = open(self.token_accounting_file, 'a', encoding='utf-8', buffering=1)
+            logger.info(f"Token accounting file created at: {self.token_accounting_file}")
+        else:
+            logger.info("Token accounting disabled")
         
         # Initialize prompt counter and token totals
         self.prompt_counter = 1
@@ -34,10 +180,47 @@ class GeminiAPI:
         # Initialize sequential counter for file naming
         self.sequence_counter = 1
     
-    def log_token_accounting(self, input_tokens, output_tokens, prompt_summary="", operation_name="", source_file=""):
+    def _debug_writer(self):
+        """Drain the write queue on a background thread"""
+        while True:
+            item = self._debug_q.get()
+            try:
+                kind = item[0]
+                if kind == 'file':
+                    _, path, text = item
+                    with open(path, 'w', encoding='utf-8') as f:
+                        f.write(text)
+                elif kind == 'acct':
+                    self._acct_fh.write(item[1])
+            except Exception as e:
+                logger.error(f"Error writing debug file: {str(e)}")
+            finally:
+                self._debug_q.task_done()
+
+    def _ensure_debug_dir(self):
+        """Create the debug directory on first use"""
+        if not self._debug_dir_ready:
+            os.makedirs(DEBUG_API_CALLS_DIR, exist_ok=True)
+            self._debug_dir_ready = True
+            logger.info(f"Debug AI calls directory created at: {DEBUG_API_CALLS_DIR}")
+
+    def _save_debug_file(self, filename, text):
+        """Queue a debug payload for the background writer and return its path"""
+        self._ensure_debug_dir()
+        path = os.path.join(DEBUG_API_CALLS_DIR, filename)
+        self._debug_q.put(('file', path, text))
+        return path
+
+    def flush_debug(self):
+        """Block until all queued debug/accounting writes have hit disk"""
+        self._debug_q.join()
+
+    def log_token_accounting(self, input_tokens, output_tokens, prompt_summary="", operation_name="", source_file="", timestamp=None):
         """Log token usage to the accounting file with focus on files and prompts"""
         total_tokens = input_tokens + output_tokens
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        # Callers that already formatted a timestamp for this call pass it in
+        if timestamp is None:
+            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
         # Keep track of totals
         self.total_input_tokens += input_tokens
@@ -63,63 +246,599 @@ class GeminiAPI:
         entry_name = (entry_name[:40] + "...") if len(entry_name) > 43 else entry_name.ljust(43)
         entry_type = entry_type[:16].ljust(16)
         
-        with open(self.token_accounting_file, 'a', encoding='utf-8') as f:
-            f.write(f"{timestamp} | {entry_name} | {entry_type} | {input_tokens:>12,d} | {output_tokens:>13,d} | {total_tokens:>13,d}\n")
-        
+        if self.enable_accounting:
+            self._debug_q.put(('acct', f"{timestamp} | {entry_name} | {entry_type} | {input_tokens:>12,d} | {output_tokens:>13,d} | {total_tokens:>13,d}\n"))
+
         logger.info(f"Token accounting: {entry_type.strip()} - {entry_name.strip()} - Input: {input_tokens:,}, Output: {output_tokens:,}, Total: {total_tokens:,}")
         return total_tokens
     
     def finalize_token_accounting(self):
         """Write the grand total row to the token accounting file"""
         total_tokens = self.total_input_tokens + self.total_output_tokens
+        if not self.enable_accounting:
+            logger.info(f"TOKEN ACCOUNTING SUMMARY - Total Input: {self.total_input_tokens:,}, Total Output: {self.total_output_tokens:,}, Grand Total: {total_tokens:,}")
+            return
         
-        with open(self.token_accounting_file, 'a', encoding='utf-8') as f:
-            f.write("--------------------|-------------------------------------------|------------------|--------------|---------------|-------------\n")
-            f.write(f"GRAND TOTAL        | All Files and Prompts                      | {self.prompt_counter-1} Prompts      | {self.total_input_tokens:>12,d} | {self.total_output_tokens:>13,d} | {total_tokens:>13,d}\n")
-        
+        self._debug_q.put((
+            'acct',
+            "--------------------|-------------------------------------------|------------------|--------------|---------------|-------------\n"
+            f"GRAND TOTAL        | All Files and Prompts                      | {self.prompt_counter-1} Prompts      | {self.total_input_tokens:>12,d} | {self.total_output_tokens:>13,d} | {total_tokens:>13,d}\n"
+        ))
+        # The summary row is the last write of a run, so make sure it lands
+        self.flush_debug()
+
         logger.info(f"TOKEN ACCOUNTING SUMMARY - Total Input: {self.total_input_tokens:,}, Total Output: {self.total_output_tokens:,}, Grand Total: {total_tokens:,}")
     
-    def call_gemini_api(self, prompt, tokenizer=None, operation_name="API Call", source_file="", prompt_summary=""):
-        """Call the Gemini API to generate documentation"""
-        logger.info("Calling Gemini API")
-        url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-pro:generateContent"
-        headers = {
-            "Content-Type": "application/json",
-        }
-        
+    def close(self):
+        """Close the underlying HTTP session and release pooled connections"""
+        self.flush_debug()
+        if self._acct_fh is not None:
+            self._acct_fh.close()
+        self.session.close()
+        if self.response_cache is not None:
+            self.response_cache.close()
+        if self.semantic_cache is not None:
+            self.semantic_cache.close()
+        logger.info("HTTP session closed")
+
+    def _post_json(self, url, data, params):
+        """POST a JSON body, pre-serializing with orjson when available.
+
+        The session already carries the JSON content-type header, so sending
+        pre-encoded bytes skips stdlib json on the hot path.
+        """
+        if ORJSON_AVAILABLE:
+            return self.session.post(url, data=orjson.dumps(data), params=params)
+        return self.session.post(url, json=data, params=params)
+
+    @staticmethod
+    def _parse_retry_after(response):
+        """Parse the server-suggested retry delay in seconds, or None.
+
+        Understands Retry-After in both integer-seconds and HTTP-date forms,
+        plus X-RateLimit-Reset as either a delta or an epoch timestamp.
+        """
+        if response is None:
+            return None
+
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                try:
+                    target = parsedate_to_datetime(retry_after)
+                    return max(0.0, (target - datetime.now(timezone.utc)).total_seconds())
+                except (TypeError, ValueError):
+                    logger.warning(f"Could not parse Retry-After header: {retry_after}")
+
+        reset = response.headers.get("X-RateLimit-Reset")
+        if reset:
+            try:
+                value = float(reset)
+                # Large values are epoch timestamps rather than deltas
+                if value > 1e9:
+                    value -= time.time()
+                return max(0.0, value)
+            except ValueError:
+                logger.warning(f"Could not parse X-RateLimit-Reset header: {reset}")
+
+        # 429 bodies often carry a google.rpc.RetryInfo detail with the exact
+        # quota-reset delay (e.g. "retryDelay": "56s"), which is more precise
+        # than anything in the headers
+        try:
+            details = response.json().get("error", {}).get("details", [])
+        except Exception:
+            return None
+        for detail in details:
+            if detail.get("@type", "").endswith("RetryInfo"):
+                match = re.match(r"(\d+(?:\.\d+)?)s?$", detail.get("retryDelay", ""))
+                if match:
+                    return float(match.group(1))
+
+        return None
+
+    def _compute_retry_wait(self, retry_count, response=None):
+        """Compute how long to sleep before the next retry attempt.
+
+        Exponential backoff with jitter, never shorter than what the server
+        asked for via Retry-After / X-RateLimit-Reset.
+        """
+        wait = min(BACKOFF_CAP_SECONDS, BACKOFF_BASE_SECONDS * 2 ** retry_count)
+        wait += random.uniform(0, BACKOFF_JITTER_SECONDS)
+        server_wait = self._parse_retry_after(response)
+        if server_wait is not None:
+            wait = max(server_wait, wait)
+        return wait
+
+    def _ensure_cached_content(self, prefix):
+        """Upload a stable prompt prefix to Gemini's context cache, reusing a
+        previous handle while its TTL is still valid.
+
+        Returns the cachedContents resource name, or None when the prefix
+        cannot be cached (e.g. it is below the API's minimum token count),
+        in which case the caller must send the full prompt.
+        """
+        key = hashlib.sha256(prefix.encode('utf-8')).hexdigest()
+        entry = self._prefix_cache.get(key)
+        # Refresh the handle a minute before its TTL expires
+        if entry is not None and entry[1] - 60 > time.time():
+            return entry[0]
+
         data = {
+            "model": f"models/{MODEL_NAME}",
             "contents": [
                 {
+                    "role": "user",
                     "parts": [
                         {
-                            "text": prompt
+                            "text": prefix
                         }
                     ]
                 }
+            ],
+            "ttl": f"{CACHED_CONTENT_TTL_SECONDS}s"
+        }
+        try:
+            response = self._post_json(CACHED_CONTENT_URL, data, params={"key": self.api_key})
+            if response.status_code == 200:
+                name = _json_loads_response(response).get("name")
+                self._prefix_cache[key] = (name, time.time() + CACHED_CONTENT_TTL_SECONDS)
+                logger.info(f"Cached prompt prefix as {name} (TTL: {CACHED_CONTENT_TTL_SECONDS}s)")
+                return name
+            logger.warning(f"Could not cache prompt prefix (status {response.status_code}); sending full prompt")
+        except Exception as e:
+            logger.warning(f"Error caching prompt prefix: {str(e)}; sending full prompt")
+
+        # Remember the failure briefly so every call doesn't re-attempt the upload
+        self._prefix_cache[key] = (None, time.time() + 300)
+        return None
+
+    def _get_async_client(self):
+        """Lazily create the shared httpx.AsyncClient (HTTP/2, bounded pool)"""
+        if self.aclient is None:
+            self.aclient = httpx.AsyncClient(
+                http2=True,
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+                timeout=60,
+                headers={
+                    "Content-Type": "application/json",
+                    "Accept-Encoding": "gzip, br"
+                }
+            )
+            logger.info("Async HTTP client initialized (HTTP/2, keep-alive enabled)")
+        return self.aclient
+
+    async def aclose(self):
+        """Close the async HTTP client if it was created"""
+        if self.aclient is not None:
+            await self.aclient.aclose()
+            self.aclient = None
+            logger.info("Async HTTP client closed")
+
+    async def acall_gemini_api(self, prompt, tokenizer=None, operation_name="API Call", source_file="", prompt_summary=""):
+        """Async variant of call_gemini_api built on a shared httpx.AsyncClient.
+
+        Multiple prompts can be awaited concurrently with asyncio.gather so
+        network round-trips overlap instead of being paid serially.
+        Concurrent calls with an identical prompt are coalesced into a single
+        in-flight request whose result all callers share.
+        """
+        if not HTTPX_AVAILABLE:
+            logger.warning("httpx not available, falling back to synchronous API call")
+            return self.call_gemini_api(prompt, tokenizer, operation_name, source_file, prompt_summary)
+
+        key = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+        async with self._inflight_lock:
+            future = self._inflight.get(key)
+            if future is None:
+                future = asyncio.get_running_loop().create_future()
+                self._inflight[key] = future
+                owner = True
+            else:
+                owner = False
+
+        if not owner:
+            logger.info(f"Coalescing duplicate in-flight prompt (key {key[:12]}...)")
+            return await future
+
+        try:
+            result = await self._acall_gemini_api_impl(prompt, tokenizer, operation_name, source_file, prompt_summary)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as consumed for the case of no other waiters
+            future.exception()
+            raise
+        finally:
+            async with self._inflight_lock:
+                self._inflight.pop(key, None)
+
+    async def _acall_gemini_api_impl(self, prompt, tokenizer=None, operation_name="API Call", source_file="", prompt_summary=""):
+        """The actual async API round-trip behind the singleflight map"""
+        logger.info("Calling Gemini API (async)")
+
+        # Check the exact-match response cache before doing any work
+        cache_key = None
+        if self.response_cache is not None:
+            cache_key = ResponseCache.make_key(MODEL_NAME, prompt)
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"Response cache hit for key {cache_key[:12]}... (skipping API call)")
+                return cached
+
+        # Fall back to the semantic layer for near-duplicate prompts
+        if self.semantic_cache is not None:
+            cached = self.semantic_cache.get(prompt)
+            if cached is not None:
+                logger.info("Semantic cache hit (skipping API call)")
+                return cached
+
+        url = f"https://generativelanguage.googleapis.com/v1beta/models/{MODEL_NAME}:generateContent"
+        data = _build_request_data(prompt)
+        params = {
+            "key": self.api_key
+        }
+
+        prompt_tokens = calculate_tokens(prompt, tokenizer)
+        if prompt_tokens > MAX_TOKENS:
+            logger.error(f"Prompt exceeds max token limit: {prompt_tokens:,} > {MAX_TOKENS:,}")
+            raise Exception(f"Prompt exceeds token limit ({prompt_tokens:,} > {MAX_TOKENS:,})")
+
+        client = self._get_async_client()
+        max_retries = 3
+        retry_count = 0
+
+        while retry_count < max_retries:
+            start_time = time.time()
+            if ORJSON_AVAILABLE:
+                response = await client.post(url, content=orjson.dumps(data), params=params)
+            else:
+                response = await client.post(url, json=data, params=params)
+            duration = time.time() - start_time
+            logger.info(f"Received API response (status: {response.status_code}, duration: {duration:.2f} seconds)")
+
+            if response.status_code == 429:
+                retry_count += 1
+                if retry_count >= max_retries:
+                    break
+                wait_time = self._compute_retry_wait(retry_count, response)
+                logger.warning(f"Token quota exceeded. Backing off {wait_time:.1f} seconds before retry... (attempt {retry_count} of {max_retries})")
+                await asyncio.sleep(wait_time)
+                continue
+
+            if response.status_code != 200:
+                error_msg = f"API Error: {response.status_code} - {response.text}"
+                logger.error(error_msg)
+                raise Exception(error_msg)
+
+            result = _json_loads_response(response)
+            if "candidates" in result and len(result["candidates"]) > 0:
+                if "content" in result["candidates"][0] and "parts" in result["candidates"][0]["content"]:
+                    parts = result["candidates"][0]["content"]["parts"]
+                    if len(parts) > 0 and "text" in parts[0]:
+                        response_text = parts[0]["text"]
+                        # Prefer the token counts the API already computed
+                        usage = result.get("usageMetadata", {})
+                        if "candidatesTokenCount" in usage:
+                            response_tokens = usage["candidatesTokenCount"]
+                        else:
+                            response_tokens = calculate_tokens(response_text, tokenizer)
+                        self.log_token_accounting(
+                            input_tokens=prompt_tokens,
+                            output_tokens=response_tokens,
+                            prompt_summary=prompt_summary,
+                            operation_name=operation_name,
+                            source_file=source_file
+                        )
+                        if self.response_cache is not None:
+                            self.response_cache.put(cache_key, response_text)
+                        if self.semantic_cache is not None:
+                            self.semantic_cache.put(prompt, response_text)
+                        return response_text
+
+            error_msg = f"Unexpected response format: {_json_dumps_str(result)[:100]}..."
+            logger.error(error_msg)
+            raise Exception(error_msg)
+
+        raise Exception(f"Failed to call Gemini API after {max_retries} attempts")
+
+    async def gather_gemini_calls(self, prompts, tokenizer=None, operation_name="API Call"):
+        """Run several prompts concurrently and return results in order.
+
+        Failed calls are returned as exceptions rather than aborting the batch.
+        """
+        coros = [
+            self.acall_gemini_api(prompt, tokenizer, operation_name=operation_name)
+            for prompt in prompts
+        ]
+        return await asyncio.gather(*coros, return_exceptions=True)
+
+    def call_gemini_api_batch(self, prompts, tokenizer=None, operation_name="Batch API Call"):
+        """Answer several independent prompts with as few HTTP requests as possible.
+
+        Prompts are packed into batches of up to BATCH_MAX_PROMPTS (bounded by
+        the token limit), sent as one fenced request, and the multi-part
+        response is split back per prompt. Batches that fail to parse fall
+        back to one call per prompt, so the result is always a list of
+        responses aligned with the input order.
+        """
+        results = [None] * len(prompts)
+
+        # Greedily pack prompts into batches under the token budget
+        budget = int(MAX_TOKENS * 0.95)
+        batches = []
+        current = []
+        current_tokens = calculate_tokens(_BATCH_INSTRUCTION, tokenizer)
+        for i, prompt in enumerate(prompts):
+            prompt_tokens = calculate_tokens(prompt, tokenizer)
+            if current and (len(current) >= BATCH_MAX_PROMPTS or current_tokens + prompt_tokens > budget):
+                batches.append(current)
+                current = []
+                current_tokens = calculate_tokens(_BATCH_INSTRUCTION, tokenizer)
+            current.append(i)
+            current_tokens += prompt_tokens
+        if current:
+            batches.append(current)
+
+        logger.info(f"Batching {len(prompts)} prompts into {len(batches)} API calls")
+
+        for batch in batches:
+            if len(batch) == 1:
+                index = batch[0]
+                results[index] = self.call_gemini_api(prompts[index], tokenizer, operation_name=operation_name)
+                continue
+
+            sections = [
+                f"===PROMPT_{i}_START===\n{prompts[i]}\n===PROMPT_{i}_END==="
+                for i in batch
             ]
+            combined = _BATCH_INSTRUCTION + "\n\n".join(sections)
+            try:
+                response = self.call_gemini_api(
+                    combined, tokenizer,
+                    operation_name=operation_name,
+                    prompt_summary=f"Batch of {len(batch)} prompts"
+                )
+                parsed = {int(m.group(1)): m.group(2).strip() for m in _BATCH_RESPONSE_RE.finditer(response)}
+            except Exception as e:
+                logger.error(f"Batched API call failed: {str(e)}")
+                parsed = {}
+
+            missing = [i for i in batch if i not in parsed]
+            for i in batch:
+                if i in parsed:
+                    results[i] = parsed[i]
+            if missing:
+                logger.warning(f"Batch response missing {len(missing)} sections, retrying those individually")
+                for i in missing:
+                    results[i] = self.call_gemini_api(prompts[i], tokenizer, operation_name=operation_name)
+
+        return results
+
+    def _call_gemini_api_stream(self, prompt, tokenizer=None, operation_name="API Call", source_file="", prompt_summary="", stable_prefix=None, on_chunk=None):
+        """Stream a Gemini response over SSE, accumulating text as it arrives.
+
+        Overlaps downstream processing with server-side generation: on_chunk
+        is invoked per text fragment so callers can persist or display
+        partial output before the full response is complete.
+        """
+        logger.info("Calling Gemini API (streaming)")
+
+        # One timestamp per call, shared by debug output and accounting
+        ts_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+        full_prompt = (stable_prefix + prompt) if stable_prefix else prompt
+
+        # The response caches apply to streaming calls as well
+        cache_key = None
+        if self.response_cache is not None:
+            cache_key = ResponseCache.make_key(MODEL_NAME, full_prompt)
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"Response cache hit for key {cache_key[:12]}... (skipping API call)")
+                if on_chunk is not None:
+                    on_chunk(cached)
+                return cached
+        if self.semantic_cache is not None:
+            cached = self.semantic_cache.get(full_prompt)
+            if cached is not None:
+                logger.info("Semantic cache hit (skipping API call)")
+                if on_chunk is not None:
+                    on_chunk(cached)
+                return cached
+
+        cached_content_name = None
+        if stable_prefix:
+            cached_content_name = self._ensure_cached_content(stable_prefix)
+        request_text = prompt if cached_content_name else full_prompt
+
+        if stable_prefix:
+            prompt_tokens = calculate_tokens(stable_prefix, tokenizer) + calculate_tokens(prompt, tokenizer)
+        else:
+            prompt_tokens = calculate_tokens(full_prompt, tokenizer)
+        if prompt_tokens > MAX_TOKENS:
+            logger.error(f"Prompt exceeds max token limit: {prompt_tokens:,} > {MAX_TOKENS:,}")
+            raise Exception(f"Prompt exceeds token limit ({prompt_tokens:,} > {MAX_TOKENS:,})")
+
+        url = f"https://generativelanguage.googleapis.com/v1beta/models/{MODEL_NAME}:streamGenerateContent"
+        data = _build_request_data(request_text)
+        if cached_content_name:
+            data["cachedContent"] = cached_content_name
+        params = {
+            "key": self.api_key,
+            "alt": "sse"
         }
-        
+
+        max_retries = 3
+        retry_count = 0
+        start_time = time.time()
+
+        while retry_count < max_retries:
+            if ORJSON_AVAILABLE:
+                response = self.session.post(url, data=orjson.dumps(data), params=params, stream=True)
+            else:
+                response = self.session.post(url, json=data, params=params, stream=True)
+
+            if response.status_code == 429:
+                retry_count += 1
+                if retry_count >= max_retries:
+                    break
+                wait_time = self._compute_retry_wait(retry_count, response)
+                logger.warning(f"Token quota exceeded. Backing off {wait_time:.1f} seconds before retry... (attempt {retry_count} of {max_retries})")
+                time.sleep(wait_time)
+                continue
+
+            if response.status_code != 200:
+                error_msg = f"API Error: {response.status_code} - {response.text}"
+                logger.error(error_msg)
+                self.sequence_counter += 1
+                raise Exception(error_msg)
+
+            fragments = []
+            first_fragment_time = None
+            for line in response.iter_lines():
+                if not line or not line.startswith(b"data:"):
+                    continue
+                payload = line[len(b"data:"):].strip()
+                if payload == b"[DONE]":
+                    break
+                try:
+                    chunk = orjson.loads(payload) if ORJSON_AVAILABLE else json.loads(payload)
+                except ValueError:
+                    logger.warning("Skipping malformed SSE chunk")
+                    continue
+                candidates = chunk.get("candidates", [])
+                if not candidates:
+                    continue
+                parts = candidates[0].get("content", {}).get("parts", [])
+                for part in parts:
+                    text = part.get("text")
+                    if text:
+                        if first_fragment_time is None:
+                            first_fragment_time = time.time()
+                            logger.info(f"First response fragment after {first_fragment_time - start_time:.2f} seconds")
+                        fragments.append(text)
+                        if on_chunk is not None:
+                            on_chunk(text)
+
+            duration = time.time() - start_time
+            response_text = "".join(fragments)
+            logger.info(f"Streamed response complete (length: {len(response_text):,} characters, duration: {duration:.2f} seconds)")
+
+            response_tokens = calculate_tokens(response_text, tokenizer)
+            self.log_token_accounting(
+                input_tokens=prompt_tokens,
+                output_tokens=response_tokens,
+                prompt_summary=prompt_summary,
+                operation_name=operation_name,
+                source_file=source_file,
+                timestamp=ts_str
+            )
+
+            if self.debug_ai_calls:
+                text_file = self._save_debug_file(
+                    f"{self.sequence_counter:02d}-extracted_text.txt",
+                    f"Operation: {operation_name}\n"
+                    f"Timestamp: {ts_str}\n"
+                    f"Tokens: {response_tokens:,}\n"
+                    "\n--- RESPONSE CONTENT ---\n\n"
+                    f"{response_text}"
+                )
+                logger.info(f"DEBUG: Extracted text saved to {text_file}")
+
+            self.sequence_counter += 1
+
+            if self.response_cache is not None:
+                self.response_cache.put(cache_key, response_text)
+            if self.semantic_cache is not None:
+                self.semantic_cache.put(full_prompt, response_text)
+
+            return response_text
+
+        self.sequence_counter += 1
+        raise Exception(f"Failed to call Gemini API after {max_retries} attempts")
+
+    def call_gemini_api(self, prompt, tokenizer=None, operation_name="API Call", source_file="", prompt_summary="", stable_prefix=None, stream=False, on_chunk=None):
+        """Call the Gemini API to generate documentation
+
+        When stable_prefix is given, the prefix is uploaded once to Gemini's
+        context cache (cachedContents) and only the variable part of the
+        prompt is sent per call; cached prefix tokens are billed at a
+        fraction and skip prefill. If the prefix cannot be cached the full
+        prompt is sent as before.
+
+        With stream=True the response is consumed incrementally from
+        streamGenerateContent; each text fragment is passed to on_chunk (if
+        given) as it arrives, and the full text is returned as usual.
+        """
+        if stream:
+            return self._call_gemini_api_stream(prompt, tokenizer, operation_name, source_file, prompt_summary, stable_prefix, on_chunk)
+
+        logger.info("Calling Gemini API")
+
+        # Hoist the debug flag and per-call file prefix so the disabled case
+        # costs a single local check per branch and no string formatting
+        _debug = self.debug_ai_calls
+        seq_prefix = f"{self.sequence_counter:02d}-" if _debug else ""
+
+        # One timestamp per call, reused by every debug file and the
+        # accounting row instead of re-running datetime.now().strftime
+        ts_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+        # The caches and token limit always apply to the complete prompt
+        full_prompt = (stable_prefix + prompt) if stable_prefix else prompt
+
+        # Check the exact-match response cache before doing any work
+        cache_key = None
+        if self.response_cache is not None:
+            cache_key = ResponseCache.make_key(MODEL_NAME, full_prompt)
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"Response cache hit for key {cache_key[:12]}... (skipping API call)")
+                return cached
+
+        # Fall back to the semantic layer for near-duplicate prompts
+        if self.semantic_cache is not None:
+            cached = self.semantic_cache.get(full_prompt)
+            if cached is not None:
+                logger.info("Semantic cache hit (skipping API call)")
+                return cached
+
+        # Try to reuse a server-side cached copy of the stable prefix
+        cached_content_name = None
+        if stable_prefix:
+            cached_content_name = self._ensure_cached_content(stable_prefix)
+
+        # With a cache handle only the variable suffix goes over the wire
+        request_text = prompt if cached_content_name else full_prompt
+
+        url = f"https://generativelanguage.googleapis.com/v1beta/models/{MODEL_NAME}:generateContent"
+
+        data = _build_request_data(request_text)
+        if cached_content_name:
+            data["cachedContent"] = cached_content_name
+
         # Include API key as query parameter
         params = {
             "key": self.api_key
         }
         
-        # Calculate tokens for entire request including prompt
-        prompt_tokens = calculate_tokens(prompt, tokenizer)
-        logger.info(f"Making API request to Gemini (prompt length: {len(prompt):,} characters, approximately {prompt_tokens:,} tokens)")
-        
-        # Auto-generate prompt summary if not provided
+        # Calculate tokens for entire request including prompt; counting the
+        # prefix separately lets the memo cache in calculate_tokens make it
+        # O(1) on every call after the first
+        if stable_prefix:
+            prompt_tokens = calculate_tokens(stable_prefix, tokenizer) + calculate_tokens(prompt, tokenizer)
+        else:
+            prompt_tokens = calculate_tokens(full_prompt, tokenizer)
+        logger.info(f"Making API request to Gemini (prompt length: {len(full_prompt):,} characters, approximately {prompt_tokens:,} tokens)")
+
+        # Auto-generate prompt summary if not provided; the regex finds the
+        # first non-blank line without splitting the whole prompt into a list
         if not prompt_summary:
-            # Get first line that's not empty
-            for line in prompt.splitlines():
-                line = line.strip()
-                if line:
-                    prompt_summary = line
-                    break
-            
-            # If still no summary, use the first 50 characters
-            if not prompt_summary:
-                prompt_summary = prompt[:50]
+            m = _FIRST_LINE_RE.search(full_prompt)
+            prompt_summary = m.group(0)[:50] if m else full_prompt[:50]
         
         if prompt_tokens > MAX_TOKENS:
             logger.error(f"Prompt exceeds max token limit: {prompt_tokens:,} > {MAX_TOKENS:,}")
@@ -128,26 +847,26 @@ class GeminiAPI:
         start_time = time.time()
         
         # Log the full prompt if debug mode is enabled
-        if self.debug_ai_calls:
-            # Write the prompt to a file with sequential numbering
-            prompt_file = os.path.join(DEBUG_API_CALLS_DIR, f"{self.sequence_counter:02d}-prompt.txt")
-            with open(prompt_file, 'w', encoding='utf-8') as f:
-                f.write(f"Operation: {operation_name}\n")
-                f.write(f"Source file: {source_file}\n")
-                f.write(f"Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                f.write(f"Tokens: {prompt_tokens:,}\n")
-                f.write("\n--- PROMPT CONTENT ---\n\n")
-                f.write(prompt)
-            
+        if _debug:
+            # Queue the prompt for the background writer with sequential numbering
+            prompt_file = self._save_debug_file(
+                seq_prefix + "prompt.txt",
+                f"Operation: {operation_name}\n"
+                f"Source file: {source_file}\n"
+                f"Timestamp: {ts_str}\n"
+                f"Tokens: {prompt_tokens:,}\n"
+                "\n--- PROMPT CONTENT ---\n\n"
+                f"{full_prompt}"
+            )
+
             logger.info(f"DEBUG: Full prompt saved to {prompt_file}")
-            print(f"\n[DEBUG] Full prompt saved to {prompt_file}")
         
         max_retries = 3
         retry_count = 0
         
         while retry_count < max_retries:
             try:
-                response = requests.post(url, headers=headers, json=data, params=params)
+                response = self._post_json(url, data, params)
                 end_time = time.time()
                 duration = end_time - start_time
                 
@@ -155,31 +874,29 @@ class GeminiAPI:
                 
                 # Handle rate limiting (429 errors)
                 if response.status_code == 429:
-                    error_data = response.json() if response.text else {"error": {"message": "Rate limit exceeded"}}
-                    error_msg = f"API Error: {response.status_code} - {json.dumps(error_data)}"
+                    # Decode the body once; every response.text access
+                    # re-decodes the raw bytes
+                    body_text = response.text
+                    error_data = _json_loads_response(response) if body_text else {"error": {"message": "Rate limit exceeded"}}
+                    error_msg = f"API Error: {response.status_code} - {_json_dumps_str(error_data)}"
                     logger.error(error_msg)
                     
                     # Log the error response if debug mode is enabled
-                    if self.debug_ai_calls:
-                        # Write the error response to a file with sequential numbering
-                        error_file = os.path.join(DEBUG_API_CALLS_DIR, f"{self.sequence_counter:02d}-error.txt")
-                        with open(error_file, 'w', encoding='utf-8') as f:
-                            f.write(f"Status Code: {response.status_code}\n\n{response.text}")
-                        
+                    if _debug:
+                        # Queue the error response with sequential numbering
+                        error_file = self._save_debug_file(
+                            seq_prefix + "error.txt",
+                            f"Status Code: {response.status_code}\n\n{body_text}"
+                        )
+
                         logger.error(f"DEBUG: HTTP error saved to {error_file}")
-                        print(f"\n[DEBUG] HTTP error saved to {error_file}")
-                    
+
                     if prompt_tokens <= MAX_TOKENS:
                         # Wait and retry if we're within token limits but just hitting quota
-                        wait_time = 60  # seconds
-                        logger.warning(f"Token quota exceeded. Waiting {wait_time} seconds before retry...")
-                        
-                        # Print countdown every 10 seconds
-                        for remaining in range(wait_time, 0, -10):
-                            logger.info(f"Waiting... (time left: {remaining} seconds)")
-                            print(f"Waiting... (time left: {remaining} seconds)")
-                            time.sleep(min(10, remaining))
-                        
+                        wait_time = self._compute_retry_wait(retry_count, response)
+                        logger.warning(f"Token quota exceeded. Backing off {wait_time:.1f} seconds before retry...")
+                        time.sleep(wait_time)
+
                         retry_count += 1
                         logger.info(f"Retrying API call (attempt {retry_count} of {max_retries})")
                         continue
@@ -190,83 +907,97 @@ class GeminiAPI:
                         raise Exception(f"Token quota exceeded and prompt is too large ({prompt_tokens:,} > {MAX_TOKENS:,})")
                 
                 # Save the full response if debug mode is enabled
-                if self.debug_ai_calls and response.status_code == 200:
-                    # Write the raw response to a file with sequential numbering
-                    response_file = os.path.join(DEBUG_API_CALLS_DIR, f"{self.sequence_counter:02d}-response.json")
-                    with open(response_file, 'w', encoding='utf-8') as f:
-                        f.write(response.text)
-                    
+                if _debug and response.status_code == 200:
+                    # Queue the raw response with sequential numbering
+                    response_file = self._save_debug_file(
+                        seq_prefix + "response.json",
+                        response.text
+                    )
+
                     logger.info(f"DEBUG: Full API response saved to {response_file}")
-                    print(f"\n[DEBUG] Full API response saved to {response_file}")
                 
                 if response.status_code == 200:
-                    result = response.json()
+                    result = _json_loads_response(response)
                     # Extract the text from the response
                     if "candidates" in result and len(result["candidates"]) > 0:
                         if "content" in result["candidates"][0] and "parts" in result["candidates"][0]["content"]:
                             parts = result["candidates"][0]["content"]["parts"]
                             if len(parts) > 0 and "text" in parts[0]:
                                 response_text = parts[0]["text"]
-                                response_tokens = calculate_tokens(response_text, tokenizer)
+                                # Prefer the token counts the API already computed
+                                usage = result.get("usageMetadata", {})
+                                if "candidatesTokenCount" in usage:
+                                    response_tokens = usage["candidatesTokenCount"]
+                                else:
+                                    response_tokens = calculate_tokens(response_text, tokenizer)
                                 logger.info(f"Extracted response text (length: {len(response_text):,} characters, approximately {response_tokens:,} tokens)")
                                 
                                 # Log to token accounting with focus on prompt details
                                 self.log_token_accounting(
                                     input_tokens=prompt_tokens,
-                                    output_tokens=response_tokens, 
+                                    output_tokens=response_tokens,
                                     prompt_summary=prompt_summary,
                                     operation_name=operation_name,
-                                    source_file=source_file
+                                    source_file=source_file,
+                                    timestamp=ts_str
                                 )
                                 
                                 # Save the extracted text response if debug mode is enabled
-                                if self.debug_ai_calls:
-                                    # Write the extracted text to a file with sequential numbering
-                                    text_file = os.path.join(DEBUG_API_CALLS_DIR, f"{self.sequence_counter:02d}-extracted_text.txt")
-                                    with open(text_file, 'w', encoding='utf-8') as f:
-                                        f.write(f"Operation: {operation_name}\n")
-                                        f.write(f"Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                                        f.write(f"Tokens: {response_tokens:,}\n")
-                                        f.write("\n--- RESPONSE CONTENT ---\n\n")
-                                        f.write(response_text)
-                                    
+                                if _debug:
+                                    # Queue the extracted text with sequential numbering
+                                    text_file = self._save_debug_file(
+                                        seq_prefix + "extracted_text.txt",
+                                        f"Operation: {operation_name}\n"
+                                        f"Timestamp: {ts_str}\n"
+                                        f"Tokens: {response_tokens:,}\n"
+                                        "\n--- RESPONSE CONTENT ---\n\n"
+                                        f"{response_text}"
+                                    )
+
                                     logger.info(f"DEBUG: Extracted text saved to {text_file}")
-                                    print(f"\n[DEBUG] Extracted text saved to {text_file}")
                                 
                                 # Increment sequence counter for the next interaction
                                 self.sequence_counter += 1
-                                
+
+                                if self.response_cache is not None:
+                                    self.response_cache.put(cache_key, response_text)
+                                if self.semantic_cache is not None:
+                                    self.semantic_cache.put(full_prompt, response_text)
+
                                 return response_text
                     
-                    error_msg = f"Unexpected response format: {json.dumps(result)[:100]}..."
+                    error_msg = f"Unexpected response format: {_json_dumps_str(result)[:100]}..."
                     logger.error(error_msg)
                     
                     # Log the full response on error if debug mode is enabled
-                    if self.debug_ai_calls:
-                        # Write the error response to a file with sequential numbering
-                        error_file = os.path.join(DEBUG_API_CALLS_DIR, f"{self.sequence_counter:02d}-error_response.json")
-                        with open(error_file, 'w', encoding='utf-8') as f:
-                            f.write(json.dumps(result, indent=2))
-                        
+                    if _debug:
+                        # Queue the error response with sequential numbering
+                        error_file = self._save_debug_file(
+                            seq_prefix + "error_response.json",
+                            _json_dumps_str(result, indent=True)
+                        )
+
                         logger.error(f"DEBUG: Error response saved to {error_file}")
-                        print(f"\n[DEBUG] Error response saved to {error_file}")
                     
                     # Increment sequence counter even for failed attempts
                     self.sequence_counter += 1
                     raise Exception(error_msg)
                 else:
-                    error_msg = f"API Error: {response.status_code} - {response.text}"
+                    # Decode the body once for both the message and the
+                    # debug write
+                    body_text = response.text
+                    error_msg = f"API Error: {response.status_code} - {body_text}"
                     logger.error(error_msg)
-                    
+
                     # Log the error response if debug mode is enabled
-                    if self.debug_ai_calls:
-                        # Write the error response to a file with sequential numbering
-                        error_file = os.path.join(DEBUG_API_CALLS_DIR, f"{self.sequence_counter:02d}-http_error.txt")
-                        with open(error_file, 'w', encoding='utf-8') as f:
-                            f.write(f"Status Code: {response.status_code}\n\n{response.text}")
-                        
+                    if _debug:
+                        # Queue the error response with sequential numbering
+                        error_file = self._save_debug_file(
+                            seq_prefix + "http_error.txt",
+                            f"Status Code: {response.status_code}\n\n{body_text}"
+                        )
+
                         logger.error(f"DEBUG: HTTP error saved to {error_file}")
-                        print(f"\n[DEBUG] HTTP error saved to {error_file}")
                     
                     # Increment sequence counter even for failed attempts
                     self.sequence_counter += 1
@@ -275,14 +1006,9 @@ class GeminiAPI:
                 if retry_count < max_retries - 1 and "quota exceeded" in str(e).lower():
                     # Only retry if it's a quota issue
                     retry_count += 1
-                    wait_time = 60  # seconds
-                    logger.warning(f"API call failed with quota error. Retrying in {wait_time} seconds... (attempt {retry_count} of {max_retries})")
-                    
-                    # Print countdown every 10 seconds
-                    for remaining in range(wait_time, 0, -10):
-                        logger.info(f"Waiting... (time left: {remaining} seconds)")
-                        print(f"Waiting... (time left: {remaining} seconds)")
-                        time.sleep(min(10, remaining))
+                    wait_time = self._compute_retry_wait(retry_count)
+                    logger.warning(f"API call failed with quota error. Retrying in {wait_time:.1f} seconds... (attempt {retry_count} of {max_retries})")
+                    time.sleep(wait_time)
                 else:
                     logger.error(f"Exception during API call: {str(e)}")
                     # Increment sequence counter even for failed attempts
@@ -20,20 +20,24 @@ DEBUG_API_CALLS_DIR = os.path.join(run_log_dir, "debug_ai_calls")
 
 def setup_logger():
     """Configure and return a logger for the application"""
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(LOG_FILE, encoding='utf-8'),
-            logging.StreamHandler()  # Also log to console
-        ]
-    )
     logger = logging.getLogger("ProjectPromptGenerator")
-    
-    # Log the directory structure for debugging
-    logger.info(f"Log file created at: {LOG_FILE}")
-    logger.info(f"Debug API calls will be stored in: {DEBUG_API_CALLS_DIR}")
-    
+
+    # Guard against re-running setup (e.g. repeated imports): basicConfig
+    # would silently be a no-op, so attach handlers explicitly exactly once
+    if not logger.handlers:
+        logger.setLevel(logging.INFO)
+        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+        file_handler = logging.FileHandler(LOG_FILE, encoding='utf-8')
+        file_handler.setFormatter(formatter)
+        stream_handler = logging.StreamHandler()  # Also log to console
+        stream_handler.setFormatter(formatter)
+        logger.addHandler(file_handler)
+        logger.addHandler(stream_handler)
+
+        # Log the directory structure for debugging
+        logger.info(f"Log file created at: {LOG_FILE}")
+        logger.info(f"Debug API calls will be stored in: {DEBUG_API_CALLS_DIR}")
+
     return logger
 
 logger = setup_logger()
\ No newline at end of file
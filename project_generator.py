@@ -1,22 +1,165 @@
+import io
 import os
 import re
 import json
+import fnmatch
 import time
 import logging
-from pathlib import Path
-from datetime import datetime
-from dotenv import load_dotenv
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
 from logger_config import logger, run_log_dir
 from token_utils import calculate_tokens, get_tokenizer, MAX_TOKENS
-from gemini_api import GeminiAPI
+
+# Optional C-implemented JSON serializer; string-heavy payloads (file
+# contents) encode several times faster than with the stdlib
+try:
+    import orjson
+
+    def _json_dumps(obj, indent=False):
+        option = orjson.OPT_INDENT_2 if indent else 0
+        return orjson.dumps(obj, option=option).decode("utf-8")
+except ImportError:
+    def _json_dumps(obj, indent=False):
+        return json.dumps(obj, indent=2 if indent else None)
+
+# Regexes used by the fallback technical-details extraction, compiled once
+# at import. The code-element patterns are fused into one alternation with
+# named groups so each file is scanned once instead of five times; the
+# match is dispatched on whichever group fired.
+_CODE_ELEMENT_RE = re.compile(
+    r"def\s+(?P<fn_name>[a-zA-Z_][a-zA-Z0-9_]*)\s*\((?P<fn_params>[^)]*)\)"
+    r"|class\s+(?P<cls_name>[a-zA-Z_][a-zA-Z0-9_]*)"
+    r"|@(?:app|router)\.(?:route|get|post|put|delete)\s*\(\s*['\"](?P<route_path>[^'\"]+)['\"]"
+    r"|(?:api|endpoints|url)\s*\(\s*['\"](?P<api_path>[^'\"]+)['\"]"
+    r"|(?P<const_name>[A-Z][A-Z0-9_]*)\s*=\s*(?P<const_val>[^,;\n]+)"
+)
+_CONFIG_KV_RE = re.compile(r"([a-zA-Z_][a-zA-Z0-9_]*)\s*[=:]\s*([^,;\n]+)")
+
+
+def _short(value):
+    """Trim an extracted value for display in the fallback document"""
+    value = value.strip()
+    if len(value) > 30:
+        return value[:30] + "..."
+    return value
+
+# .env is read and parsed at most once per process; repeated generator
+# instantiations (batch runs, daemons) reuse the environment variables
+# already populated by the first load
+_DOTENV_LOADED = False
+
+def _load_dotenv_once():
+    global _DOTENV_LOADED
+    if not _DOTENV_LOADED:
+        # Deferred import: dotenv is only needed when no key is passed in
+        from dotenv import load_dotenv
+        load_dotenv()
+        _DOTENV_LOADED = True
+
+# Optional RE2 engine for the ignore matcher: linear-time DFA execution
+# instead of re's backtracking NFA, which pays off on repos with hundreds
+# of .gitignore patterns
+try:
+    import re2
+    RE2_AVAILABLE = True
+    logger.info("google-re2 available: using RE2 for ignore pattern matching")
+except ImportError:
+    RE2_AVAILABLE = False
+
+# Instruction blocks for the two Gemini calls. They are byte-stable by
+# construction (no per-run values interpolated), which keeps them eligible
+# for Gemini context caching, and hoisting them to module level means the
+# interpreter builds each string once at import instead of per call.
+_FILE_SELECTION_INSTRUCTIONS = """
+You are an expert developer analyzing the project described above. I need you to identify which files are the most important to examine
+in order to understand this project's structure, purpose, and functionality, with special emphasis on the core business logic.
+
+The purpose of this analysis is to help AI coding assistants understand the project scope precisely to reduce hallucinations
+and improve the efficiency of AI completions. Focus on files that reveal the core logical flows and business rules.
+
+Based on this information, list ONLY the filenames (with paths) of the most important files to examine.
+DO NOT include any explanation, commentary, or analysis.
+Just provide a list of the most important files, one per line, prioritizing:
+
+1. Files containing core business logic and domain rules
+2. Files that define key workflows and processes
+3. Files with critical application logic (not just configuration or UI)
+4. Main entry point files that show how the application logic flows
+5. Files that define data models and their relationships
+
+Avoid focusing too much on:
+- Style files (CSS, SCSS)
+- Static assets
+- Test files (unless they clearly demonstrate business logic)
+- Build configuration files
+- External libraries
+
+Example response format:
+src/main.py
+lib/core.py
+models/user.py
+services/authentication.py
+        """
+
+_PROJECT_PROMPT_INSTRUCTIONS = """
+You are an expert developer who is analyzing a project to create a specialized document ONLY FOR AI ASSISTANTS (not for human developers).
+Your task is to create an optimized PROJECT_PROMPT.json file that will prevent AI hallucinations and make AI tools focus precisely on the project scope.
+
+## TECHNICAL EXTRACTION REQUIREMENTS
+
+This document must be highly technical and focus on extracting critical details that developers and AI tools need repeatedly:
+
+1. EXTRACT SPECIFIC TECHNICAL ELEMENTS:
+   - All important variable names, constants, and their values/types
+   - Route names and URL patterns (e.g., in web frameworks like Symphony, Express, Flask)
+   - API endpoints with their HTTP methods and parameters
+   - Database table/collection names and their relationships
+   - Function signatures with parameter types and return values
+   - Configuration values and environment variables
+   - Class hierarchies and inheritance relationships
+   - Key component dependencies and their versions
+
+2. CREATE KEY-VALUE REFERENCE TABLES:
+   - Create organized, searchable tables of routes, variables, and constants
+   - Format these as structured JSON objects or markdown tables for quick lookup
+   - Include context about where each element is defined and used
+
+3. ORGANIZE BY TECHNICAL DOMAIN:
+   - Group related elements by technical categories (Routes, Models, Controllers, etc.)
+   - Create clear cross-references between related components
+   - Maintain consistent naming conventions for easy searching
+
+4. CREATE TECHNICAL DIAGRAMS:
+   - Flow diagrams showing request/response cycles
+   - Entity relationships and data flows
+   - Component interaction patterns
+   - Execution order of key operations
+
+Remember, the primary goal is to help AI tools:
+- Use exact variable/route names instead of hallucinating them
+- Understand precise technical implementation details
+- Have reference tables they can consult for accuracy
+- Minimize guesswork when suggesting code modifications
+
+## OUTPUT FORMAT GUIDELINES
+
+1. Format your response as markdown text optimized for AI parsing
+2. Create clear section headers with distinctive markers
+3. Use structured lists, tables, or code blocks for technical reference data
+4. Organize information hierarchically from system-level to implementation details
+5. Include a "Technical Reference" section with exact names of key elements
+
+The resulting document will serve as a precise technical reference for AI tools to understand the project's implementation details,
+reducing token waste and improving the quality of AI completions by preventing hallucinations about variable names, routes, and other critical technical elements.
+        """
 
 class ProjectPromptGenerator:
     def __init__(self, api_key=None):
         logger.info("Initializing ProjectPromptGenerator")
         # Load API key from .env file if not provided
         if api_key is None:
-            load_dotenv()
+            _load_dotenv_once()
             self.api_key = os.getenv("GEMINI_API_KEY")
             if not self.api_key:
                 logger.error("GEMINI_API_KEY not found in .env file")
@@ -54,7 +197,13 @@ class ProjectPromptGenerator:
         self.important_files = []
         self.ai_selected_files = []
         self.file_contents = {}
+        self.file_token_counts = {}  # Token count per loaded file
         self.file_stats = {}  # Track stats like size, modified date, etc.
+        self._base_info_tokens = 0
+        self._tree_str = None  # Cached output of generate_file_tree_string
+        self._byte_budget_remaining = None  # Set once the token budget is known
+        self._by_basename = {}  # basename -> full paths, built by the walker
+        self._file_set = set()  # Set mirror of file_tree for membership tests
         self.readme_exists = False
         self.readme_content = ""
         self.project_summary = ""
@@ -68,16 +217,47 @@ class ProjectPromptGenerator:
             r"dist", r"build", r"tmp", r"temp", r"coverage"
         ]
         logger.info(f"Initialized with {len(self.ignored_patterns)} default ignore patterns")
+        # Compiled union of all ignore patterns; rebuilt whenever the list changes
+        self._ignore_re = None
+        # Directory basenames pruned with an O(1) set lookup before any path
+        # join or regex work - keeps the walker out of node_modules and co.
+        # Literal basenames (configuration files, entry points, docs) checked
+        # by the fallback important-file sweep before any regex work
+        self._important_names = frozenset({
+            "package.json", "setup.py", "requirements.txt", "Gemfile",
+            "composer.json", ".gitignore", ".env.example", "Dockerfile",
+            "docker-compose.yml", "tsconfig.json", "webpack.config.js",
+            "index.js", "index.ts", "index.py", "index.php", "index.html",
+            "app.js", "app.ts", "app.py", "app.php",
+            "main.js", "main.ts", "main.py", "main.php",
+            "README.md", "CONTRIBUTING.md", "LICENSE",
+        })
+        # Common source directories (limit to a few files per directory)
+        self._important_dir_re = re.compile(
+            r"^(src|app|lib|core|controllers|models|views|templates|public|tests|docs)/")
+        self.ignored_dir_names = frozenset({
+            ".git", ".vscode", ".idea", "__pycache__", "node_modules",
+            "vendor", "cache", "log", "dist", "build", "tmp", "temp", "coverage"
+        })
+        # Literal (glob-free, slash-free) .gitignore lines; matched against
+        # entry basenames without any regex work
+        self._ignored_names = frozenset()
         
-        # Initialize tokenizer
-        self.tokenizer = get_tokenizer()
-        if self.tokenizer:
-            logger.info("Tokenizer initialized for model: gemini-1.5-pro")
-        else:
-            logger.info("Using estimated token counting")
+        # Tokenizer is created lazily on first use - loading the vertexai
+        # model data is slow and some runs never count a token
+        self._tokenizer_obj = None
+        self._tokenizer_ready = False
         
+        # Check whether the response cache should be disabled
+        self.use_response_cache = os.getenv("DISABLE_RESPONSE_CACHE", "false").lower() != "true"
+        if not self.use_response_cache:
+            logger.info("DISABLE_RESPONSE_CACHE is set - API responses will not be cached")
+
         # Initialize API client
-        self.api_client = GeminiAPI(self.api_key, self.debug_ai_calls)
+        # Deferred import keeps the API client (requests, caches, optional
+        # httpx) off the critical path for invocations that never get here
+        from gemini_api import GeminiAPI
+        self.api_client = GeminiAPI(self.api_key, self.debug_ai_calls, use_cache=self.use_response_cache)
         
         # Initialize vector database if available
         try:
@@ -96,164 +276,214 @@ class ProjectPromptGenerator:
         
         # Add patterns from .gitignore if it exists
         self.add_gitignore_patterns()
-        
+
+    @property
+    def tokenizer(self):
+        """Tokenizer instance, initialized on first access"""
+        if not self._tokenizer_ready:
+            self._tokenizer_obj = get_tokenizer()
+            self._tokenizer_ready = True
+            if self._tokenizer_obj:
+                logger.info("Tokenizer initialized for model: gemini-1.5-pro")
+            else:
+                logger.info("Using estimated token counting")
+        return self._tokenizer_obj
+
+    def _compile_ignore_patterns(self):
+        """Compile all ignore patterns into one union regex.
+
+        A single C-level scan per path replaces one re.search call per
+        pattern, which dominates the directory walk on large trees. RE2 is
+        preferred when installed: its runtime is linear in the path length
+        regardless of how many patterns the union contains.
+
+        Extension-only patterns like \\.jpg$ are pulled out into a frozenset
+        first - a hash lookup on the file's suffix settles the common
+        media-file case before the regex runs at all.
+        """
+        ext_only = re.compile(r"^\\\.(\w+)\$$")
+        exts = set()
+        rest = []
+        for p in self.ignored_patterns:
+            m = ext_only.match(p)
+            if m:
+                exts.add("." + m.group(1).lower())
+            else:
+                rest.append(p)
+        self._ignored_exts = frozenset(exts)
+        union = "|".join(f"(?:{p})" for p in rest)
+        if RE2_AVAILABLE:
+            try:
+                self._ignore_re = re2.compile(union)
+                return
+            except re2.error as e:
+                logger.warning(f"RE2 rejected ignore pattern union, falling back to re: {e}")
+        self._ignore_re = re.compile(union)
+
     def add_gitignore_patterns(self):
         """Read patterns from .gitignore and add them to ignored_patterns"""
         gitignore_path = os.path.join(self.root_dir, ".gitignore")
-        if os.path.exists(gitignore_path):
+        # Open directly instead of exists-then-open: one syscall, no
+        # race between the check and the read
+        try:
+            f = open(gitignore_path, 'r', encoding='utf-8', errors='ignore')
+        except FileNotFoundError:
+            f = None
+        if f is not None:
             logger.info("Reading .gitignore file")
             gitignore_count = 0
-            
-            with open(gitignore_path, 'r', encoding='utf-8', errors='ignore') as f:
+            literal_names = set(self._ignored_names)
+
+            with f:
                 for line in f:
                     # Skip empty lines and comments
                     line = line.strip()
                     if not line or line.startswith('#'):
                         continue
-                    
-                    # Convert gitignore pattern to regex pattern
-                    # Handle basic pattern types
+
+                    # Negation patterns un-ignore files; a union regex cannot
+                    # express that, so err toward including those files
+                    if line.startswith('!'):
+                        logger.debug("Skipping gitignore negation pattern: %s", line)
+                        continue
+
                     pattern = line
-                    
+
                     # Remove leading slash if present (indicates project root)
                     if pattern.startswith('/'):
                         pattern = pattern[1:]
-                    
+
                     # Handle directory indicator (trailing slash)
                     is_dir = pattern.endswith('/')
                     if is_dir:
                         pattern = pattern[:-1]
-                    
-                    # Escape special regex characters
-                    pattern = re.escape(pattern)
-                    
-                    # Convert gitignore glob patterns to regex
-                    # Replace * with .* (any characters)
-                    pattern = pattern.replace('\\*', '.*')
-                    
-                    # Replace ? with . (any single character)
-                    pattern = pattern.replace('\\?', '.')
-                    
+
+                    gitignore_count += 1
+
+                    # Most real gitignore lines need no regex at all:
+                    # plain names become set entries matched against the
+                    # entry basename, and *.ext lines feed the extension
+                    # fast path; only genuine globs reach the regex union
+                    has_glob = any(c in pattern for c in "*?[")
+                    if not has_glob and '/' not in pattern:
+                        literal_names.add(pattern)
+                        continue
+                    if (pattern.startswith("*.") and '/' not in pattern
+                            and not any(c in pattern[2:] for c in "*?[")):
+                        self.ignored_patterns.append(rf"\.{re.escape(pattern[2:])}$")
+                        continue
+
+                    # fnmatch.translate handles *, ? and [...] character
+                    # classes correctly, unlike the previous manual
+                    # escape-then-unescape round trip; strip its (?s:...)\Z
+                    # wrapper so the body can be anchored per pattern type
+                    translated = fnmatch.translate(pattern)
+                    pattern = translated[len('(?s:'):-len(')\\Z')]
+
                     # Handle directory specific pattern
                     if is_dir:
                         self.ignored_patterns.append(f"^{pattern}$|^{pattern}/|/{pattern}/")
                     else:
                         # For files, match either the exact name or path ending with this name
                         self.ignored_patterns.append(f"^{pattern}$|/{pattern}$")
-                    
-                    gitignore_count += 1
             
+            self._ignored_names = frozenset(literal_names)
             logger.info(f"Added {gitignore_count} patterns from .gitignore")
         else:
             logger.warning("No .gitignore file found")
+
+        # (Re)compile the union regex now that the pattern list is final
+        self._compile_ignore_patterns()
         
     def generate_file_tree_string(self):
-        """Generate a string representation of the file tree"""
-        tree_str = "Project File Structure:\n"
-        
-        # Group files by directory
+        """Generate a string representation of the file tree.
+
+        The result is cached - the tree string is needed several times per
+        run (file selection prompt, base info, final project data) and the
+        file tree does not change between those uses.
+        """
+        if self._tree_str is not None:
+            return self._tree_str
+
+        # Accumulate into a list and join once - += on a growing string is
+        # quadratic in the worst case for trees with thousands of files
+        lines = ["Project File Structure:\n"]
+
+        # Group files by directory. file_tree is sorted once at the end of
+        # the walk, which keeps each per-directory list sorted here (paths
+        # sharing a directory prefix order by filename); rpartition splits
+        # dir/name in a single pass instead of the split + dirname +
+        # basename triple traversal
         dirs = {}
-        for file_path in sorted(self.file_tree):
-            parts = file_path.split(os.sep)
-            if len(parts) == 1:  # Root level file
-                dirs.setdefault('', []).append(parts[0])
-            else:
-                dir_path = os.path.dirname(file_path)
-                filename = os.path.basename(file_path)
-                dirs.setdefault(dir_path, []).append(filename)
-        
-        # Generate tree structure string
+        for file_path in self.file_tree:
+            dir_path, _, filename = file_path.rpartition(os.sep)
+            dirs.setdefault(dir_path, []).append(filename)
+
+        # Generate tree structure lines
         def print_dir(dir_name, files, prefix=""):
-            result = ""
             if dir_name:
-                result += f"{prefix}└── {dir_name}/\n"
+                lines.append(f"{prefix}└── {dir_name}/\n")
                 new_prefix = prefix + "    "
             else:
                 new_prefix = prefix
-            
-            for i, file in enumerate(sorted(files)):
+
+            for i, file in enumerate(files):
                 is_last = i == len(files) - 1
                 if is_last:
-                    result += f"{new_prefix}└── {file}\n"
+                    lines.append(f"{new_prefix}└── {file}\n")
                 else:
-                    result += f"{new_prefix}├── {file}\n"
-            return result
-        
+                    lines.append(f"{new_prefix}├── {file}\n")
+
         # Start with root level files
         if '' in dirs:
-            for i, file in enumerate(sorted(dirs[''])):
-                is_last = i == len(dirs['']) - 1 and len(dirs) == 1
+            root_files = dirs.pop('')
+            for i, file in enumerate(root_files):
+                is_last = i == len(root_files) - 1 and not dirs
                 if is_last:
-                    tree_str += f"└── {file}\n"
+                    lines.append(f"└── {file}\n")
                 else:
-                    tree_str += f"├── {file}\n"
-            dirs.pop('')
-        
+                    lines.append(f"├── {file}\n")
+
         # Process directories (sort by path depth to ensure proper nesting)
         sorted_dirs = sorted(dirs.items(), key=lambda x: x[0].count(os.sep))
         for dir_path, files in sorted_dirs:
-            parent_prefix = ""
-            for i in range(dir_path.count(os.sep)):
-                parent_prefix += "    "
-            
-            tree_str += print_dir(os.path.basename(dir_path), files, parent_prefix)
-        
-        return tree_str
+            parent_prefix = "    " * dir_path.count(os.sep)
+            print_dir(os.path.basename(dir_path), files, parent_prefix)
+
+        self._tree_str = "".join(lines)
+        return self._tree_str
     
     def ask_ai_for_important_files(self):
         """Ask the AI which files are important to examine more closely"""
         logger.info("Asking AI to identify important files")
         
-        # Create a prompt with README content and file tree
+        # Create a prompt with README content and file tree. The project
+        # context leads the prompt as a stable prefix so Gemini's context
+        # caching can reuse its prefill across calls and runs while the
+        # repo is unchanged; the instructions follow in the variable part.
         file_tree_str = self.generate_file_tree_string()
-        
-        prompt = f"""
-You are an expert developer analyzing a project. I need you to identify which files are the most important to examine
-in order to understand this project's structure, purpose, and functionality, with special emphasis on the core business logic.
-
-The purpose of this analysis is to help AI coding assistants understand the project scope precisely to reduce hallucinations 
-and improve the efficiency of AI completions. Focus on files that reveal the core logical flows and business rules.
 
+        stable_prefix = f"""
 Here is the project's README.md (if available):
 {self.readme_content if self.readme_exists else "No README.md found."}
 
 Here is the project's file structure:
 {file_tree_str}
+"""
 
-Based on this information, list ONLY the filenames (with paths) of the most important files to examine.
-DO NOT include any explanation, commentary, or analysis.
-Just provide a list of the most important files, one per line, prioritizing:
-
-1. Files containing core business logic and domain rules
-2. Files that define key workflows and processes
-3. Files with critical application logic (not just configuration or UI)
-4. Main entry point files that show how the application logic flows
-5. Files that define data models and their relationships
-
-Avoid focusing too much on:
-- Style files (CSS, SCSS)
-- Static assets 
-- Test files (unless they clearly demonstrate business logic)
-- Build configuration files
-- External libraries
+        prompt = _FILE_SELECTION_INSTRUCTIONS
 
-Example response format:
-src/main.py
-lib/core.py
-models/user.py
-services/authentication.py
-        """
-        
         logger.debug(f"AI prompt for file selection: {prompt[:100]}...")
         
         try:
             # Call the API with enhanced token accounting information
             response = self.api_client.call_gemini_api(
-                prompt, 
-                self.tokenizer, 
+                prompt,
+                self.tokenizer,
                 operation_name="File Selection Analysis",
                 source_file="project_generator.py",
-                prompt_summary="Identify important project files"
+                prompt_summary="Identify important project files",
+                stable_prefix=stable_prefix
             )
             file_list = response.strip().split('\n')
             
@@ -266,20 +496,23 @@ services/authentication.py
             for file in file_list:
                 # Normalize path separators for comparison
                 normalized_file = file.replace('/', os.sep).replace('\\', os.sep)
-                if normalized_file in self.file_tree:
+                if normalized_file in self._file_set:
                     valid_files.append(normalized_file)
-                    logger.info(f"AI selected file (direct match): {normalized_file}")
+                    logger.info("AI selected file (direct match): %s", normalized_file)
                 else:
-                    # Try to find the closest match
+                    # Try to find the closest match - only paths sharing the
+                    # suggested basename can match, so consult the index
+                    # instead of scanning the whole tree
                     found = False
-                    for existing_file in self.file_tree:
+                    candidates = self._by_basename.get(os.path.basename(normalized_file), [])
+                    for existing_file in candidates:
                         if normalized_file in existing_file or existing_file.endswith(normalized_file):
                             valid_files.append(existing_file)
-                            logger.info(f"AI selected file (partial match): {existing_file} for {normalized_file}")
+                            logger.info("AI selected file (partial match): %s for %s", existing_file, normalized_file)
                             found = True
                             break
                     if not found:
-                        logger.warning(f"AI suggested file not found in project: {normalized_file}")
+                        logger.warning("AI suggested file not found in project: %s", normalized_file)
             
             self.ai_selected_files = valid_files
             logger.info(f"AI identified {len(self.ai_selected_files)} valid important files")
@@ -312,8 +545,9 @@ services/authentication.py
         if self.readme_exists:
             base_info["readme_content"] = self.readme_content
             
-        base_json = json.dumps(base_info, indent=2)
+        base_json = _json_dumps(base_info, indent=True)
         total_tokens = calculate_tokens(base_json, self.tokenizer)
+        self._base_info_tokens = total_tokens
         logger.info(f"Base project info: {total_tokens:,} tokens")
         
         # Log base project info to token accounting
@@ -325,28 +559,62 @@ services/authentication.py
             source_file=""
         )
         
-        # Add files until we approach the token limit
+        # Add files until we approach the token limit. Reads are fanned out
+        # across threads, then admission runs on a cheap ~4-bytes-per-token
+        # estimate so rejected candidates never touch the tokenizer; only
+        # the admitted set is counted exactly (also threaded), and if the
+        # exact total still overshoots, the largest files are evicted.
         file_contents = {}
-        for file_path in files_to_load:
-            content = self.read_file_content(file_path)
-            content_tokens = calculate_tokens(content, self.tokenizer)
-            
-            if total_tokens + content_tokens <= MAX_TOKENS * 0.95:  # Leave 5% buffer
+        file_token_counts = {}
+        self._byte_budget_remaining = int((MAX_TOKENS - total_tokens) * 4)
+        workers = min(16, max(1, len(files_to_load)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            contents = list(executor.map(self.read_file_content, files_to_load))
+
+        budget = int(MAX_TOKENS * 0.95)  # Leave 5% buffer
+        admitted = []
+        est_used = 0
+        for file_path, content in zip(files_to_load, contents):
+            estimate = len(content) // 4
+            if total_tokens + est_used + estimate <= budget:
+                admitted.append((file_path, content))
+                est_used += estimate
+                self._byte_budget_remaining -= estimate * 4
+            else:
+                logger.warning(f"Skipping {file_path}: Would exceed token limit ({total_tokens + est_used + estimate:,} > {MAX_TOKENS:,})")
+                break
+
+        if admitted:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                exact_counts = list(executor.map(
+                    calculate_tokens,
+                    (content for _, content in admitted),
+                    (self.tokenizer for _ in admitted)))
+            for (file_path, content), content_tokens in zip(admitted, exact_counts):
                 file_contents[file_path] = content
+                file_token_counts[file_path] = content_tokens
                 total_tokens += content_tokens
-                logger.info(f"Added {file_path}: {content_tokens:,} tokens (Total: {total_tokens:,})")
-                
+
+            # The estimate admits slightly optimistically; drop the largest
+            # files until the exact total fits the budget again
+            while total_tokens > budget and file_token_counts:
+                largest = max(file_token_counts, key=file_token_counts.get)
+                evicted_tokens = file_token_counts.pop(largest)
+                del file_contents[largest]
+                total_tokens -= evicted_tokens
+                logger.warning("Dropping %s: exact count exceeded the token budget", largest)
+
+            for file_path, content_tokens in file_token_counts.items():
+                logger.info("Added %s: %s tokens (Total so far counted exactly)", file_path, f"{content_tokens:,}")
                 # Log each file to token accounting
                 self.api_client.log_token_accounting(
                     input_tokens=content_tokens,
                     output_tokens=0,
                     source_file=file_path
                 )
-            else:
-                logger.warning(f"Skipping {file_path}: Would exceed token limit ({total_tokens + content_tokens:,} > {MAX_TOKENS:,})")
-                break
-                
+
         self.file_contents = file_contents
+        self.file_token_counts = file_token_counts
         logger.info(f"Loaded {len(file_contents)} files with {total_tokens:,} tokens (Limit: {MAX_TOKENS:,})")
         return file_contents
     
@@ -380,72 +648,135 @@ services/authentication.py
     def check_readme(self):
         """Check if README.md exists"""
         readme_path = os.path.join(self.root_dir, "README.md")
-        if os.path.exists(readme_path):
-            self.readme_exists = True
-            logger.info("README.md found")
-            
-            # Read README content for later use
-            with open(readme_path, 'r', encoding='utf-8') as f:
+        # Open directly instead of exists-then-open: one syscall, no
+        # race between the check and the read
+        try:
+            with open(readme_path, 'r', encoding='utf-8', errors='ignore') as f:
                 self.readme_content = f.read()
-                logger.info(f"README.md contains {len(self.readme_content):,} characters")
-        else:
+        except FileNotFoundError:
             logger.warning("README.md not found")
+        else:
+            self.readme_exists = True
+            logger.info("README.md found")
+            logger.info(f"README.md contains {len(self.readme_content):,} characters")
     
     def analyze_project_structure(self):
         """Analyze the project structure and create a file tree"""
         logger.info("Scanning directory structure...")
-        
-        def should_ignore(path):
-            return any(re.search(pattern, path) for pattern in self.ignored_patterns)
-        
-        # Walk through directory and collect files/folders
-        for root, dirs, files in os.walk(self.root_dir):
-            # Filter out directories we want to ignore
-            dirs[:] = [d for d in dirs if not should_ignore(os.path.join(root, d))]
-            
-            rel_path = os.path.relpath(root, self.root_dir)
-            if rel_path == '.':
-                for file in files:
-                    if not should_ignore(file):
-                        self.file_tree.append(file)
-            else:
-                for file in files:
-                    file_path = os.path.join(rel_path, file)
-                    if not should_ignore(file_path):
-                        self.file_tree.append(file_path)
-        
+
+        if self._ignore_re is None:
+            self._compile_ignore_patterns()
+        ignore_search = self._ignore_re.search
+        ignored_dir_names = self.ignored_dir_names
+        ignored_exts = self._ignored_exts
+        ignored_names = self._ignored_names
+
+        # Manual scandir traversal: DirEntry.name and is_dir() come straight
+        # from readdir without an extra stat, and the relative path is built
+        # with a running prefix instead of os.path.join/os.path.relpath per
+        # entry. Results accumulate in locals and publish to self.file_tree
+        # once at the end.
+        #
+        # The walk keeps forward-slash relative paths so anchored ignore
+        # patterns like ^src/ match on Windows too; tree entries are
+        # converted back to os.sep only where the separators differ. Each
+        # directory is tested exactly once, when it is pushed, so no
+        # prefix is re-matched for the files underneath it.
+        native_sep = os.sep != "/"
+        tree = []
+        # Size/mtime per accepted file, taken from the DirEntry stat cache
+        # readdir already filled in - later stages reuse these instead of
+        # issuing a second stat syscall per file
+        file_stats = {}
+
+        def scan_one(frame):
+            """Scan a single directory; returns (subdir frames, files, stats)"""
+            dir_path, rel_prefix = frame
+            subdirs = []
+            files = []
+            stats = {}
+            try:
+                entries = os.scandir(dir_path)
+            except OSError as e:
+                logger.error(f"Error scanning directory {dir_path}: {str(e)}")
+                return subdirs, files, stats
+            with entries:
+                for entry in entries:
+                    name = entry.name
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    if name in ignored_names:
+                        continue
+                    rel_path = rel_prefix + name
+                    if is_dir:
+                        if name in ignored_dir_names:
+                            continue
+                        if ignore_search(rel_path) is None:
+                            subdirs.append((entry.path, rel_path + "/"))
+                    elif ("." + name.rpartition(".")[2].lower()) in ignored_exts:
+                        continue
+                    elif ignore_search(rel_path) is None:
+                        if native_sep:
+                            rel_path = rel_path.replace("/", os.sep)
+                        files.append(rel_path)
+                        try:
+                            st = entry.stat(follow_symlinks=False)
+                            stats[rel_path] = (st.st_size, st.st_mtime)
+                        except OSError:
+                            pass
+            return subdirs, files, stats
+
+        # Walk breadth-first in waves. scandir and stat release the GIL, so
+        # once a wave holds several directories the frontier is fanned out
+        # across threads; small waves stay on this thread to avoid pool
+        # overhead on shallow trees.
+        frontier = [(self.root_dir, "")]
+        with ThreadPoolExecutor(max_workers=min(16, os.cpu_count() or 4)) as executor:
+            while frontier:
+                if len(frontier) >= 4:
+                    results = list(executor.map(scan_one, frontier))
+                else:
+                    results = [scan_one(frame) for frame in frontier]
+                frontier = []
+                for subdirs, files, stats in results:
+                    frontier.extend(subdirs)
+                    tree.extend(files)
+                    file_stats.update(stats)
+
+        # Sort once here so every consumer (tree string, prompts, cache
+        # keys) sees a deterministic order regardless of scan interleaving
+        tree.sort()
+        self.file_tree = tree
+        self.file_stats = file_stats
+        # Set mirror of the tree for O(1) membership checks
+        self._file_set = set(tree)
+        # Basename index used by the AI-selection partial-match fallback
+        by_basename = defaultdict(list)
+        for rel_path in tree:
+            by_basename[os.path.basename(rel_path)].append(rel_path)
+        self._by_basename = by_basename
+        # The cached tree string (if any) is stale once the tree changes
+        self._tree_str = None
         logger.info(f"Found {len(self.file_tree)} files")
     
     def identify_important_files_fallback(self):
         """Identify important files in the project as a fallback if AI selection fails"""
         logger.info("Identifying important files with fallback method")
         
-        # Patterns for important files
-        important_patterns = [
-            # Configuration files
-            r"package\.json$", r"setup\.py$", r"requirements\.txt$", r"Gemfile$", 
-            r"composer\.json$", r"\.gitignore$", r"\.env\.example$", r"Dockerfile$",
-            r"docker-compose\.yml$", r"\.eslintrc", r"tsconfig\.json$", r"webpack\.config\.js$",
-            
-            # Main entry points
-            r"index\.(js|ts|py|php|html)$", r"app\.(js|ts|py|php)$", r"main\.(js|ts|py|php)$", 
-            
-            # Documentation
-            r"README\.md$", r"CONTRIBUTING\.md$", r"LICENSE$",
-            
-            # Common source directories (limit to a few files per directory)
-            r"^src/", r"^app/", r"^lib/", r"^core/", r"^controllers/", r"^models/",
-            r"^views/", r"^templates/", r"^public/", r"^tests/", r"^docs/"
-        ]
-        
         # Clear previous list if any
         self.important_files = []
-        
-        # Identify files that match the important patterns
+
+        # Most patterns are literal basenames, so an O(1) set lookup handles
+        # them; only the .eslintrc* family and directory prefixes need regexes
         for file_path in self.file_tree:
-            if any(re.search(pattern, file_path) for pattern in important_patterns):
+            basename = os.path.basename(file_path)
+            if (basename in self._important_names
+                    or basename.startswith(".eslintrc")
+                    or self._important_dir_re.match(file_path)):
                 self.important_files.append(file_path)
-                logger.info(f"Important: {file_path}")
+                logger.info("Important: %s", file_path)
         
         logger.info(f"Identified {len(self.important_files)} important files")
     
@@ -481,7 +812,7 @@ services/authentication.py
                     for file_path in self.file_tree:
                         if re.search(pattern, file_path):
                             self.ai_selected_files.append(file_path)
-                            logger.info(f"Manually included: {file_path}")
+                            logger.info("Manually included: %s", file_path)
                 logger.info(f"Manually included {len(self.ai_selected_files)} files")
             else:
                 logger.warning("Manual mode selected but no include patterns specified, falling back to automatic detection")
@@ -494,96 +825,78 @@ services/authentication.py
         """Read the entire content of a file"""
         full_path = os.path.join(self.root_dir, file_path)
         try:
-            with open(full_path, 'r', encoding='utf-8', errors='ignore') as f:
-                return f.read()
+            # Skip files that cannot possibly fit in the remaining token
+            # budget (~4 bytes per token) without reading them at all; the
+            # size comes from the walker's stat cache when available
+            if self._byte_budget_remaining is not None:
+                stats = self.file_stats.get(file_path)
+                size = stats[0] if stats else os.path.getsize(full_path)
+                if size > self._byte_budget_remaining:
+                    logger.warning("Skipping %s: larger than remaining token budget", file_path)
+                    return ""
+            # Binary read + one bulk decode is much faster than text mode,
+            # which runs the incremental decoder line by line. A NUL byte in
+            # the head marks a binary blob that would only pollute the
+            # prompt, so skip those outright
+            with open(full_path, 'rb') as f:
+                data = f.read()
+            if b'\x00' in data[:8192]:
+                logger.warning("Skipping %s: appears to be a binary file", file_path)
+                return ""
+            return data.decode('utf-8', 'ignore')
         except Exception as e:
             logger.error(f"Error reading file {file_path}: {str(e)}")
             return f"Error reading file: {str(e)}"
     
     def generate_project_prompt(self):
         """Generate the PROJECT_PROMPT.md file using Gemini API specifically for AI assistants"""
-        # Prepare project data with file contents
-        project_data = {
-            "name": os.path.basename(self.root_dir),
-            "file_count": len(self.file_tree),
-            "file_tree": self.generate_file_tree_string(),
-            "file_contents": self.file_contents,
-        }
-        
+        # Stream the project data into a buffer fragment by fragment instead
+        # of serializing one dict that already holds every file's content -
+        # dumps on that dict briefly holds a second escaped copy of the
+        # entire payload in memory
+        buf = io.StringIO()
+        buf.write("{\n")
+        buf.write(f'  "name": {_json_dumps(os.path.basename(self.root_dir))},\n')
+        buf.write(f'  "file_count": {len(self.file_tree)},\n')
+        buf.write(f'  "file_tree": {_json_dumps(self.generate_file_tree_string())},\n')
         if self.readme_exists:
-            project_data["readme_content"] = self.readme_content
-        
-        # Convert project data to a string for the prompt
-        data_str = json.dumps(project_data, indent=2)
-        
-        # Calculate tokens for verification
-        data_tokens = calculate_tokens(data_str, self.tokenizer)
-        logger.info(f"Data being sent to Gemini: {data_tokens:,} tokens")
-        
-        prompt = f"""
-You are an expert developer who is analyzing a project to create a specialized document ONLY FOR AI ASSISTANTS (not for human developers).
-Your task is to create an optimized PROJECT_PROMPT.json file that will prevent AI hallucinations and make AI tools focus precisely on the project scope.
-
-## TECHNICAL EXTRACTION REQUIREMENTS
-
-This document must be highly technical and focus on extracting critical details that developers and AI tools need repeatedly:
-
-1. EXTRACT SPECIFIC TECHNICAL ELEMENTS:
-   - All important variable names, constants, and their values/types
-   - Route names and URL patterns (e.g., in web frameworks like Symphony, Express, Flask)
-   - API endpoints with their HTTP methods and parameters
-   - Database table/collection names and their relationships
-   - Function signatures with parameter types and return values
-   - Configuration values and environment variables
-   - Class hierarchies and inheritance relationships
-   - Key component dependencies and their versions
-
-2. CREATE KEY-VALUE REFERENCE TABLES:
-   - Create organized, searchable tables of routes, variables, and constants
-   - Format these as structured JSON objects or markdown tables for quick lookup
-   - Include context about where each element is defined and used
+            buf.write(f'  "readme_content": {_json_dumps(self.readme_content)},\n')
+        buf.write('  "file_contents": {')
+        for i, (file_path, content) in enumerate(self.file_contents.items()):
+            buf.write(",\n    " if i else "\n    ")
+            buf.write(f"{_json_dumps(file_path)}: {_json_dumps(content)}")
+        buf.write("\n  }\n}")
+        data_str = buf.getvalue()
+        buf.close()
 
-3. ORGANIZE BY TECHNICAL DOMAIN:
-   - Group related elements by technical categories (Routes, Models, Controllers, etc.)
-   - Create clear cross-references between related components
-   - Maintain consistent naming conventions for easy searching
-
-4. CREATE TECHNICAL DIAGRAMS:
-   - Flow diagrams showing request/response cycles
-   - Entity relationships and data flows
-   - Component interaction patterns
-   - Execution order of key operations
-
-Remember, the primary goal is to help AI tools:
-- Use exact variable/route names instead of hallucinating them
-- Understand precise technical implementation details
-- Have reference tables they can consult for accuracy
-- Minimize guesswork when suggesting code modifications
+        # Every component was already tokenized during loading, so the total
+        # is arithmetic over cached counts instead of re-tokenizing the blob
+        if self.file_token_counts:
+            data_tokens = self._base_info_tokens + sum(self.file_token_counts.values())
+        else:
+            data_tokens = calculate_tokens(data_str, self.tokenizer)
+        logger.info(f"Data being sent to Gemini: approximately {data_tokens:,} tokens")
+        
+        # Keep the instruction block byte-stable (no timestamps or per-run
+        # values) so it can be reused via Gemini's context caching; only the
+        # project data below varies between calls
+        stable_prefix = _PROJECT_PROMPT_INSTRUCTIONS
 
+        prompt = f"""
 Here is the project information:
 {data_str}
-
-## OUTPUT FORMAT GUIDELINES
-
-1. Format your response as markdown text optimized for AI parsing
-2. Create clear section headers with distinctive markers
-3. Use structured lists, tables, or code blocks for technical reference data
-4. Organize information hierarchically from system-level to implementation details
-5. Include a "Technical Reference" section with exact names of key elements
-
-The resulting document will serve as a precise technical reference for AI tools to understand the project's implementation details,
-reducing token waste and improving the quality of AI completions by preventing hallucinations about variable names, routes, and other critical technical elements.
         """
-        
+
         # Call Gemini API
         logger.info("Calling Gemini API to generate AI-focused technical documentation")
         try:
             response = self.api_client.call_gemini_api(
-                prompt, 
-                self.tokenizer, 
+                prompt,
+                self.tokenizer,
                 operation_name="Project Prompt Generation",
                 source_file="project_generator.py",
-                prompt_summary="Generate technical PROJECT_PROMPT for AI assistants"
+                prompt_summary="Generate technical PROJECT_PROMPT for AI assistants",
+                stable_prefix=stable_prefix
             )
             content = response.strip()
             
@@ -623,7 +936,9 @@ reducing token waste and improving the quality of AI completions by preventing h
         project_name = os.path.basename(self.root_dir)
         file_count = len(self.file_tree)
         
-        content = f"""# PROJECT_PROMPT - TECHNICAL REFERENCE FOR AI ASSISTANTS
+        # Build the document as a list of parts and join once at the end;
+        # repeated += on the content string copies every file body again
+        parts = [f"""# PROJECT_PROMPT - TECHNICAL REFERENCE FOR AI ASSISTANTS
 
 > **IMPORTANT**: This document is specifically designed as a technical reference for AI assistants.
 > It contains precise variable names, routes, endpoints, and other technical details to prevent hallucinations.
@@ -640,37 +955,37 @@ Technical reference for {project_name}. The project contains {file_count} files.
 ## Technical Reference: Important Files
 The following files are considered most important for understanding the project architecture:
 
-"""
+"""]
         files_to_list = self.ai_selected_files if self.ai_selected_files else self.important_files
         for file in files_to_list:
-            content += f"- `{file}`\n"
-        
-        content += "\n## Technical Reference: Key Variables and Constants\n"
-        
+            parts.append(f"- `{file}`\n")
+
+        parts.append("\n## Technical Reference: Key Variables and Constants\n")
+
         # Extract some basic technical information from files
         technical_details = self.extract_basic_technical_details()
         for category, items in technical_details.items():
-            content += f"\n### {category}\n"
+            parts.append(f"\n### {category}\n")
             if items:
                 for item in items:
-                    content += f"- {item}\n"
+                    parts.append(f"- {item}\n")
             else:
-                content += "No items identified in this category.\n"
-        
-        content += "\n## Technical Reference: File Contents\n"
-        
+                parts.append("No items identified in this category.\n")
+
+        parts.append("\n## Technical Reference: File Contents\n")
+
         for file_path, file_content in self.file_contents.items():
-            content += f"\n### `{file_path}`\n"
-            content += "```\n"
+            parts.append(f"\n### `{file_path}`\n")
+            parts.append("```\n")
             # Only truncate if extremely large to keep the fallback file reasonable
             if len(file_content) > 5000:
-                content += file_content[:5000]
-                content += "\n... (truncated, full content available in source file)"
+                parts.append(file_content[:5000])
+                parts.append("\n... (truncated, full content available in source file)")
             else:
-                content += file_content
-            content += "\n```\n"
-        
-        content += """
+                parts.append(file_content)
+            parts.append("\n```\n")
+
+        parts.append("""
 ## AI Technical Assistance Guidelines
 When working with this codebase:
 - Use exact variable names, routes and function signatures as listed in the technical reference
@@ -678,17 +993,17 @@ When working with this codebase:
 - Respect the existing architectural patterns when suggesting code modifications
 
 This technical reference was automatically generated to help AI assistants understand the project's implementation details.
-"""
-        
-        # Write to PROJECT_PROMPT.txt (plaintext for fallback)
+""")
+        # Stream the parts straight to disk; joining them first would hold a
+        # second full copy of every (possibly truncated) file body in memory
         project_root_file = os.path.join(self.root_dir, "PROJECT_PROMPT.txt")
         with open(project_root_file, 'w', encoding='utf-8') as f:
-            f.write(content)
-            
+            f.writelines(parts)
+
         # Also save a copy in the current log directory
         log_file = os.path.join(run_log_dir, "PROJECT_PROMPT.txt")
         with open(log_file, 'w', encoding='utf-8') as f:
-            f.write(content)
+            f.writelines(parts)
         
         logger.info(f"Fallback technical AI-focused PROJECT_PROMPT.txt created at {project_root_file}")
         logger.info(f"Copy saved to log directory at {log_file}")
@@ -704,58 +1019,37 @@ This technical reference was automatically generated to help AI assistants under
             "Configuration Values": []
         }
         
-        # Simple regex patterns to identify common technical elements
-        import re
-        patterns = {
-            "Functions": r"def\s+([a-zA-Z_][a-zA-Z0-9_]*)\s*\(([^)]*)\)",
-            "Routes": r"@(?:app|router)\.(?:route|get|post|put|delete)\s*\(\s*['\"]([^'\"]+)['\"]",
-            "Constants": r"([A-Z][A-Z0-9_]*)\s*=\s*([^,;]+)",
-            "Classes": r"class\s+([a-zA-Z_][a-zA-Z0-9_]*)",
-            "API Endpoints": r"(?:api|endpoints|url)\s*\(\s*['\"]([^'\"]+)['\"]",
-        }
-        
         for file_path, content in self.file_contents.items():
             file_ext = os.path.splitext(file_path)[1].lower()
             
-            # Extract elements based on file type
+            # Extract code elements in a single scan of the file; routes and
+            # endpoints only apply to scripting languages, so those groups
+            # are ignored for Java sources
             if file_ext in ['.py', '.js', '.ts', '.php', '.rb', '.java']:
-                # Extract functions
-                for match in re.finditer(patterns["Functions"], content):
-                    fn_name = match.group(1)
-                    params = match.group(2).strip()
-                    technical_details["Functions"].append(f"`{fn_name}({params})` in {file_path}")
-                
-                # Extract classes
-                for match in re.finditer(patterns["Classes"], content):
-                    class_name = match.group(1)
-                    technical_details["Classes"].append(f"`{class_name}` in {file_path}")
-                
-                # Extract constants
-                for match in re.finditer(patterns["Constants"], content):
-                    const_name = match.group(1)
-                    const_value = match.group(2).strip()
-                    if len(const_value) > 30:  # Truncate long values
-                        const_value = const_value[:30] + "..."
-                    technical_details["Constants"].append(f"`{const_name} = {const_value}` in {file_path}")
-            
-            # Extract routes
-            if file_ext in ['.py', '.js', '.ts', '.php', '.rb']:
-                for match in re.finditer(patterns["Routes"], content):
-                    route = match.group(1)
-                    technical_details["Routes"].append(f"`{route}` in {file_path}")
-                
-                for match in re.finditer(patterns["API Endpoints"], content):
-                    endpoint = match.group(1)
-                    technical_details["API Endpoints"].append(f"`{endpoint}` in {file_path}")
+                with_routes = file_ext != '.java'
+                for match in _CODE_ELEMENT_RE.finditer(content):
+                    if match.group('fn_name') is not None:
+                        fn_name = match.group('fn_name')
+                        params = match.group('fn_params').strip()
+                        technical_details["Functions"].append(f"`{fn_name}({params})` in {file_path}")
+                    elif match.group('cls_name') is not None:
+                        technical_details["Classes"].append(f"`{match.group('cls_name')}` in {file_path}")
+                    elif match.group('route_path') is not None:
+                        if with_routes:
+                            technical_details["Routes"].append(f"`{match.group('route_path')}` in {file_path}")
+                    elif match.group('api_path') is not None:
+                        if with_routes:
+                            technical_details["API Endpoints"].append(f"`{match.group('api_path')}` in {file_path}")
+                    else:
+                        const_value = _short(match.group('const_val'))
+                        technical_details["Constants"].append(f"`{match.group('const_name')} = {const_value}` in {file_path}")
             
             # Extract config values from common config files
             if 'config' in file_path.lower() or file_path.endswith(('.env', '.ini', '.cfg', '.conf')):
                 # Simple pattern to catch key = value pairs
-                for match in re.finditer(r"([a-zA-Z_][a-zA-Z0-9_]*)\s*[=:]\s*([^,;\n]+)", content):
+                for match in _CONFIG_KV_RE.finditer(content):
                     key = match.group(1)
-                    value = match.group(2).strip()
-                    if len(value) > 30:  # Truncate long values
-                        value = value[:30] + "..."
+                    value = _short(match.group(2))
                     technical_details["Configuration Values"].append(f"`{key} = {value}` in {file_path}")
         
         return technical_details
\ No newline at end of file
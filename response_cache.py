@@ -0,0 +1,187 @@
+"""
+Response cache for Gemini API calls.
+Stores responses on disk keyed by a SHA-256 hash of (model, prompt) so that
+repeated documentation runs with identical prompts return instantly with
+zero tokens billed.
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+from logger_config import logger
+
+# Try to import the embedding stack for the optional semantic cache layer
+try:
+    import numpy as np
+    from sentence_transformers import SentenceTransformer
+    SEMANTIC_CACHE_AVAILABLE = True
+    logger.info("SentenceTransformers available: semantic response cache can be enabled")
+except ImportError:
+    SEMANTIC_CACHE_AVAILABLE = False
+    logger.warning("SentenceTransformers/numpy not available. Semantic response cache disabled.")
+
+# Cache entries older than this are considered stale (7 days)
+DEFAULT_TTL_SECONDS = 7 * 24 * 60 * 60
+
+# Minimum cosine similarity for a semantic cache hit
+SEMANTIC_SIMILARITY_THRESHOLD = 0.92
+
+# Lightweight local embedder, same model the vector database uses
+SEMANTIC_CACHE_MODEL = "all-MiniLM-L6-v2"
+
+
+class ResponseCache:
+    """SQLite-backed exact-match cache for API responses"""
+
+    def __init__(self, cache_dir=None, ttl_seconds=DEFAULT_TTL_SECONDS):
+        """Initialize the response cache
+
+        Args:
+            cache_dir: Directory for the cache database (defaults to .projectprompt/cache)
+            ttl_seconds: Maximum age of a cache entry before it is ignored
+        """
+        if cache_dir is None:
+            cache_dir = os.path.join(os.getcwd(), ".projectprompt", "cache")
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self.db_path = os.path.join(cache_dir, "responses.db")
+        self.ttl_seconds = ttl_seconds
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "hash TEXT PRIMARY KEY, response TEXT, created_at INTEGER)"
+        )
+        self.conn.commit()
+        logger.info(f"Response cache initialized at: {self.db_path}")
+
+    @staticmethod
+    def make_key(model, prompt):
+        """Compute the deterministic cache key for a (model, prompt) pair"""
+        return hashlib.sha256(f"{model}|{prompt}".encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Return the cached response for key, or None on miss/expiry"""
+        row = self.conn.execute(
+            "SELECT response, created_at FROM responses WHERE hash = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        response, created_at = row
+        if time.time() - created_at > self.ttl_seconds:
+            logger.info(f"Cache entry expired for key {key[:12]}...")
+            self.conn.execute("DELETE FROM responses WHERE hash = ?", (key,))
+            self.conn.commit()
+            return None
+
+        return response
+
+    def put(self, key, response):
+        """Store a response under key, replacing any previous entry"""
+        self.conn.execute(
+            "INSERT OR REPLACE INTO responses (hash, response, created_at) VALUES (?, ?, ?)",
+            (key, response, int(time.time()))
+        )
+        self.conn.commit()
+
+    def close(self):
+        """Close the underlying database connection"""
+        self.conn.close()
+
+
+class SemanticCache:
+    """Embedding-based cache that matches near-duplicate prompts.
+
+    Layered behind the exact-match cache: prompts that differ only by a
+    whitespace diff or a small edit still reuse a previous response when
+    their embeddings are close enough in cosine similarity.
+    """
+
+    def __init__(self, cache_dir=None, ttl_seconds=DEFAULT_TTL_SECONDS,
+                 threshold=SEMANTIC_SIMILARITY_THRESHOLD):
+        """Initialize the semantic cache
+
+        Args:
+            cache_dir: Directory for the cache database (defaults to .projectprompt/cache)
+            ttl_seconds: Maximum age of a cache entry before it is ignored
+            threshold: Minimum cosine similarity to count as a hit
+        """
+        if not SEMANTIC_CACHE_AVAILABLE:
+            raise ImportError("sentence-transformers and numpy are required for the semantic cache")
+
+        if cache_dir is None:
+            cache_dir = os.path.join(os.getcwd(), ".projectprompt", "cache")
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self.db_path = os.path.join(cache_dir, "semantic_cache.db")
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self.model = SentenceTransformer(SEMANTIC_CACHE_MODEL)
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS semantic_responses ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, embedding BLOB, "
+            "response TEXT, created_at INTEGER)"
+        )
+        self.conn.commit()
+
+        # Load stored embeddings into one matrix for vectorized similarity search
+        self._load_embeddings()
+        logger.info(f"Semantic cache initialized at: {self.db_path} ({len(self.responses)} entries)")
+
+    def _load_embeddings(self):
+        """Load all unexpired embeddings and responses into memory"""
+        cutoff = int(time.time()) - self.ttl_seconds
+        rows = self.conn.execute(
+            "SELECT embedding, response FROM semantic_responses WHERE created_at >= ?",
+            (cutoff,)
+        ).fetchall()
+        self.responses = [response for _, response in rows]
+        if rows:
+            self.embeddings = np.vstack([
+                np.frombuffer(blob, dtype=np.float32) for blob, _ in rows
+            ])
+        else:
+            self.embeddings = None
+
+    def _embed(self, prompt):
+        """Embed a prompt as a unit-length float32 vector"""
+        vec = self.model.encode([prompt], convert_to_numpy=True)[0].astype(np.float32)
+        norm = np.linalg.norm(vec)
+        if norm > 0:
+            vec = vec / norm
+        return vec
+
+    def get(self, prompt):
+        """Return a cached response for a semantically similar prompt, or None"""
+        if self.embeddings is None:
+            return None
+
+        vec = self._embed(prompt)
+        # Normalized vectors make the dot product equal to cosine similarity
+        scores = self.embeddings @ vec
+        best = int(np.argmax(scores))
+        if scores[best] >= self.threshold:
+            logger.info(f"Semantic cache hit (similarity: {scores[best]:.3f})")
+            return self.responses[best]
+        return None
+
+    def put(self, prompt, response):
+        """Store the prompt embedding and response for future similarity matches"""
+        vec = self._embed(prompt)
+        self.conn.execute(
+            "INSERT INTO semantic_responses (embedding, response, created_at) VALUES (?, ?, ?)",
+            (vec.tobytes(), response, int(time.time()))
+        )
+        self.conn.commit()
+
+        self.responses.append(response)
+        if self.embeddings is None:
+            self.embeddings = vec.reshape(1, -1)
+        else:
+            self.embeddings = np.vstack([self.embeddings, vec])
+
+    def close(self):
+        """Close the underlying database connection"""
+        self.conn.close()
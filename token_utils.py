@@ -14,27 +14,54 @@ except ImportError:
 MAX_TOKENS = 1800000
 logger.info(f"Maximum token limit set to {MAX_TOKENS:,}")
 
+# Memoized token counts keyed by text hash, so repeated counts of the same
+# content (stable prompt prefixes, unchanged files) are O(1) instead of
+# re-tokenizing potentially hundreds of KB each time
+_TOKEN_CACHE_MAX = 1024
+_token_cache = {}
+
 def calculate_tokens(text, tokenizer=None):
     """Calculate the number of tokens in a text string"""
+    if not text:
+        return 0
+    if tokenizer is None:
+        # Callers that don't hold a tokenizer still get accurate counts from
+        # the shared instance instead of silently falling back to estimation
+        tokenizer = get_tokenizer()
+    cache_key = (len(text), hash(text))
+    cached = _token_cache.get(cache_key)
+    if cached is not None:
+        logger.debug(f"Token cache hit: {cached:,} tokens for text length {len(text):,}")
+        return cached
+
     if tokenizer is not None:
         try:
             result = tokenizer.count_tokens(text)
             logger.debug(f"Token calculation: {result.total_tokens:,} tokens for text length {len(text):,}")
-            return result.total_tokens
+            count = result.total_tokens
         except Exception as e:
             logger.error(f"Error calculating tokens: {str(e)}")
             # Fallback to estimation
-            estimated = len(text) // 4
-            logger.warning(f"Using estimated token count: {estimated:,}")
-            return estimated
+            count = len(text) // 4
+            logger.warning(f"Using estimated token count: {count:,}")
     else:
         # If tokenizer not available, make a rough estimate
-        estimated = len(text) // 4
-        logger.debug(f"Estimated token count: {estimated:,} for text length {len(text):,}")
-        return estimated
+        count = len(text) // 4
+        logger.debug(f"Estimated token count: {count:,} for text length {len(text):,}")
+
+    if len(_token_cache) >= _TOKEN_CACHE_MAX:
+        _token_cache.clear()
+    _token_cache[cache_key] = count
+    return count
+
+# The tokenizer is stateless, so one instance is shared by all callers
+_tokenizer = None
 
 def get_tokenizer():
-    """Get a tokenizer if available"""
+    """Get a tokenizer if available (created once and reused)"""
+    global _tokenizer
     if TOKENIZER_AVAILABLE:
-        return tokenization.get_tokenizer_for_model("gemini-1.5-pro")
+        if _tokenizer is None:
+            _tokenizer = tokenization.get_tokenizer_for_model("gemini-1.5-pro")
+        return _tokenizer
     return None
\ No newline at end of file
@@ -9,9 +9,12 @@ This module provides functionality to:
 import os
 import re
 import json
+import hashlib
+import functools
 import numpy as np
 from pathlib import Path
 from typing import List, Dict, Tuple, Optional, Union
+from concurrent.futures import ThreadPoolExecutor
 import logging
 from logger_config import logger
 
@@ -48,6 +51,50 @@ except ImportError:
     logger.warning("Google GenerativeAI not available. Fallback embedding API not available.")
 
 
+# Keywords tracked by the fallback embedding, matched in a single pass with
+# one compiled alternation instead of one text.count() scan per keyword
+_FALLBACK_KEYWORDS = ("class", "function", "def", "import", "export", "const", "var", "let",
+                      "return", "if", "else", "for", "while", "try", "catch", "async",
+                      "await", "component", "model", "controller", "view", "route",
+                      "database", "schema", "api", "http", "request", "response")
+_FALLBACK_DIM = 64
+_KEYWORD_RE = re.compile(r"\b(" + "|".join(map(re.escape, _FALLBACK_KEYWORDS)) + r")\b")
+_KEYWORD_INDEX = {keyword: i for i, keyword in enumerate(_FALLBACK_KEYWORDS)}
+
+
+def _chunk_text(text, size=1500, overlap=200):
+    """Split text into overlapping windows that fit the embedding API limit"""
+    if len(text) <= size:
+        yield text
+        return
+    step = size - overlap
+    for start in range(0, len(text), step):
+        yield text[start:start + size]
+        if start + size >= len(text):
+            break
+
+
+@functools.lru_cache(maxsize=4)
+def _load_st_model(model_name):
+    """Load a SentenceTransformer model once per process and share it.
+
+    Constructing the model reloads tens of MB of weights, so repeated
+    VectorDatabaseManager instantiations must not pay for it again. When a
+    CUDA device is present the model runs there in FP16, which roughly
+    doubles encoding throughput; any failure falls back to CPU FP32.
+    """
+    try:
+        import torch
+        if torch.cuda.is_available():
+            model = SentenceTransformer(model_name, device="cuda")
+            model.half()
+            logger.info(f"Embedding model {model_name} loaded on CUDA (FP16)")
+            return model
+    except Exception as e:
+        logger.warning(f"GPU embedding unavailable, falling back to CPU: {str(e)}")
+    return SentenceTransformer(model_name)
+
+
 class VectorDatabaseManager:
     """Manages vector embeddings and similarity search for ProjectPrompt files"""
     
@@ -63,7 +110,7 @@ class VectorDatabaseManager:
         self.api_key = api_key
         self.model_name = model_name
         self.db_path = os.path.join(root_dir, ".projectprompt", "vectordb")
-        self.model = None
+        self._model_future = None
         self.client = None
         self.collection = None
         self.is_initialized = False
@@ -73,13 +120,14 @@ class VectorDatabaseManager:
         
         # Initialize embedding function based on available libraries
         if EMBEDDINGS_AVAILABLE and self.model_name:
-            try:
-                self.model = SentenceTransformer(self.model_name)
-                logger.info(f"Loaded embedding model: {self.model_name}")
-                self.embedding_function = self._get_sentence_transformer_embeddings
-            except Exception as e:
-                logger.error(f"Failed to load embedding model: {str(e)}")
-                self.embedding_function = self._get_fallback_embeddings
+            # Start the model load on a background thread so the weights
+            # stream from disk while the rest of startup (ChromaDB open,
+            # project scan) proceeds; the first encode call joins it. Load
+            # failures surface there and fall back to keyword embeddings.
+            self._model_future = ThreadPoolExecutor(max_workers=1).submit(
+                _load_st_model, self.model_name)
+            logger.info(f"Loading embedding model in background: {self.model_name}")
+            self.embedding_function = self._get_sentence_transformer_embeddings
         elif GENAI_AVAILABLE and self.api_key:
             # Initialize Google GenerativeAI as fallback
             try:
@@ -98,9 +146,18 @@ class VectorDatabaseManager:
             try:
                 self.client = chromadb.PersistentClient(path=self.db_path)
                 # Get or create a new collection
+                # Cosine space matches the normalized embeddings; the ef/M
+                # values trade a little index-build time for better recall at
+                # the few-thousand-vector scale of a single repository
                 self.collection = self.client.get_or_create_collection(
                     name="projectprompt_files",
-                    metadata={"description": "Project file embeddings for similarity search"}
+                    metadata={
+                        "description": "Project file embeddings for similarity search",
+                        "hnsw:space": "cosine",
+                        "hnsw:construction_ef": 200,
+                        "hnsw:M": 32,
+                        "hnsw:search_ef": 64
+                    }
                 )
                 self.is_initialized = True
                 logger.info("Vector database initialized successfully")
@@ -108,11 +165,27 @@ class VectorDatabaseManager:
                 logger.error(f"Failed to initialize vector database: {str(e)}")
         else:
             logger.warning("Vector database functionality disabled due to missing dependencies")
-    
+
+    @property
+    def model(self):
+        """The embedding model, blocking until the background load finishes"""
+        if self._model_future is None:
+            return None
+        return self._model_future.result()
+
     def _get_sentence_transformer_embeddings(self, texts: List[str]) -> List[List[float]]:
         """Get embeddings using SentenceTransformers model"""
         try:
-            return self.model.encode(texts, convert_to_numpy=True).tolist()
+            # Explicit batch size lets the model exploit batched matmul on
+            # large corpora; the numpy array is kept as-is and only handed
+            # over at the ChromaDB boundary (which accepts arrays directly)
+            return self.model.encode(
+                texts,
+                batch_size=64,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False
+            )
         except Exception as e:
             logger.error(f"Error generating embeddings with SentenceTransformer: {str(e)}")
             return self._get_fallback_embeddings(texts)
@@ -120,18 +193,38 @@ class VectorDatabaseManager:
     def _get_genai_embeddings(self, texts: List[str]) -> List[List[float]]:
         """Get embeddings using Google GenerativeAI API"""
         try:
-            embeddings = []
-            for text in texts:
-                # Truncate if needed (API limit)
-                if len(text) > 2048:
-                    text = text[:2048]
+            # Large files are split into overlapping windows instead of being
+            # truncated at the API limit; each window embeds separately and
+            # the document vector is the mean over its windows
+            chunk_owner = []
+            chunks = []
+            for i, text in enumerate(texts):
+                for piece in _chunk_text(text):
+                    chunk_owner.append(i)
+                    chunks.append(piece)
+
+            def embed_one(chunk):
                 result = genai.embed_content(
                     model="models/embedding-001",
-                    content=text,
+                    content=chunk,
                     task_type="retrieval_document"
                 )
-                embeddings.append(result["embedding"])
-            return embeddings
+                return result["embedding"]
+
+            # Each call is a blocking HTTP round trip, so overlapping them in
+            # threads turns N serial network latencies into roughly one
+            workers = min(8, max(1, len(chunks)))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                chunk_vectors = list(executor.map(embed_one, chunks))
+
+            grouped = [[] for _ in texts]
+            for owner, vector in zip(chunk_owner, chunk_vectors):
+                grouped[owner].append(vector)
+            return np.asarray(
+                [vectors[0] if len(vectors) == 1 else np.mean(vectors, axis=0)
+                 for vectors in grouped],
+                dtype=np.float32
+            )
         except Exception as e:
             logger.error(f"Error generating embeddings with Google GenerativeAI: {str(e)}")
             return self._get_fallback_embeddings(texts)
@@ -141,23 +234,14 @@ class VectorDatabaseManager:
         This is a fallback when no embedding models are available
         """
         logger.warning("Using fallback embedding method (very limited capability)")
-        # Define some key programming concepts to track in the embeddings
-        keywords = ["class", "function", "def", "import", "export", "const", "var", "let",
-                   "return", "if", "else", "for", "while", "try", "catch", "async",
-                   "await", "component", "model", "controller", "view", "route",
-                   "database", "schema", "api", "http", "request", "response"]
-        
-        embeddings = []
-        for text in texts:
-            text = text.lower()
-            # Create a simple embedding vector based on keyword frequency
-            embedding = [text.count(keyword) for keyword in keywords]
-            # Normalize to unit length
-            norm = max(np.sqrt(sum([x*x for x in embedding])), 1e-6)
-            embedding = [x/norm for x in embedding]
-            # Pad to reasonable embedding dimension (64)
-            embedding = embedding + [0] * (64 - len(embedding))
-            embeddings.append(embedding)
+        # One C-level regex pass per document tallies all keywords at once;
+        # normalization runs vectorized over the whole batch
+        embeddings = np.zeros((len(texts), _FALLBACK_DIM), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for match in _KEYWORD_RE.finditer(text.lower()):
+                embeddings[row, _KEYWORD_INDEX[match.group(1)]] += 1
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True).clip(1e-6)
+        embeddings /= norms
         return embeddings
     
     def add_files(self, file_paths: List[str], file_contents: Dict[str, str]) -> bool:
@@ -175,22 +259,82 @@ class VectorDatabaseManager:
             return False
         
         try:
-            # Prepare data for the vector database
-            ids = [f"file_{i}" for i in range(len(file_paths))]
-            metadatas = [{"path": path, "type": "file"} for path in file_paths]
+            # Stable per-path ids plus a content hash in the metadata make the
+            # persistent collection incremental: rows whose content is
+            # unchanged since the last run are neither re-embedded nor
+            # rewritten
             documents = [file_contents.get(path, "") for path in file_paths]
+            ids = [hashlib.blake2b(path.encode('utf-8'), digest_size=16).hexdigest()
+                   for path in file_paths]
+            content_hashes = [hashlib.blake2b(doc.encode('utf-8'), digest_size=16).hexdigest()
+                              for doc in documents]
+
+            stored_hashes = {}
+            existing = self.collection.get(ids=ids, include=["metadatas"])
+            if existing and existing.get("ids"):
+                for row_id, metadata in zip(existing["ids"], existing["metadatas"]):
+                    stored_hashes[row_id] = (metadata or {}).get("content_hash")
+
+            changed = [i for i, row_id in enumerate(ids)
+                       if stored_hashes.get(row_id) != content_hashes[i]]
+            if not changed:
+                logger.info("Vector database already up to date, nothing to embed")
+                return True
+
+            # Identical contents (empty __init__.py files, vendored copies,
+            # generated stubs) embed once; the result is scattered back to
+            # every path that shares the text
+            unique_slots = {}
+            unique_docs = []
+            doc_slots = []
+            for i in changed:
+                document = documents[i]
+                slot = unique_slots.get(document)
+                if slot is None:
+                    slot = len(unique_docs)
+                    unique_slots[document] = slot
+                    unique_docs.append(document)
+                doc_slots.append(slot)
+
+            # Empty and binary contents get a zero vector instead of a model
+            # forward pass; everything else is embedded in one batch
+            embed_idx = [i for i, doc in enumerate(unique_docs) if doc and '\0' not in doc]
+            if embed_idx:
+                embedded = np.asarray(
+                    self.embedding_function([unique_docs[i] for i in embed_idx]),
+                    dtype=np.float32
+                )
+                dim = embedded.shape[1]
+            else:
+                embedded = None
+                dim = _FALLBACK_DIM
+
+            # The scatter stacks the rows into one contiguous float32 array so
+            # ChromaDB ingests it without an internal list-of-lists copy
+            unique_embeddings = np.zeros((len(unique_docs), dim), dtype=np.float32)
+            if embed_idx:
+                unique_embeddings[embed_idx] = embedded
+            embeddings = unique_embeddings[doc_slots]
+            if len(unique_docs) < len(changed):
+                logger.info(f"Embedded {len(unique_docs)} unique contents for {len(changed)} files")
+
+            upsert_ids = [ids[i] for i in changed]
+            upsert_documents = [documents[i] for i in changed]
+            metadatas = [{"path": file_paths[i], "type": "file", "content_hash": content_hashes[i]}
+                         for i in changed]
             
-            # Generate embeddings
-            embeddings = self.embedding_function(documents)
-            
-            # Add to collection
-            self.collection.add(
-                ids=ids,
-                embeddings=embeddings,
-                metadatas=metadatas,
-                documents=documents
-            )
-            logger.info(f"Added {len(file_paths)} files to vector database")
+            # Upsert in bounded slices so a large corpus doesn't turn into one
+            # oversized insert
+            batch = 1000
+            for start in range(0, len(upsert_ids), batch):
+                end = start + batch
+                self.collection.upsert(
+                    ids=upsert_ids[start:end],
+                    embeddings=embeddings[start:end],
+                    metadatas=metadatas[start:end],
+                    documents=upsert_documents[start:end]
+                )
+            logger.info(f"Added or updated {len(changed)} of {len(file_paths)} files in vector database")
             return True
         except Exception as e:
             logger.error(f"Error adding files to vector database: {str(e)}")
@@ -253,12 +397,26 @@ class VectorDatabaseManager:
             return []
         
         try:
-            # Query by file path in metadata
+            # Reuse the embedding stored for this file instead of re-embedding
+            # the path string, which measured similarity to the path text
+            # rather than to the file's contents
+            record = self.collection.get(
+                where={"path": file_path},
+                include=["embeddings"],
+                limit=1
+            )
+            stored = record.get("embeddings") if record else None
+            if stored is None or len(stored) == 0:
+                logger.warning(f"No stored embedding for {file_path}, cannot find related files")
+                return []
+
+            # The file itself is excluded by the filter, so no extra result
+            # slot is needed for it
             results = self.collection.query(
-                query_texts=[file_path],
-                n_results=n_results + 1,  # Add 1 to account for the file itself
-                include=["metadatas", "documents", "distances"],
-                where={"type": "file"}
+                query_embeddings=[stored[0]],
+                n_results=n_results,
+                include=["metadatas", "distances"],
+                where={"$and": [{"type": "file"}, {"path": {"$ne": file_path}}]}
             )
             
             # Format results, excluding the queried file itself